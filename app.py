@@ -8,13 +8,32 @@ import time
 import zipfile
 import io
 import random
-from datetime import datetime, date
-from flask import Flask, request, jsonify, send_from_directory, send_file, Response
+import math
+import heapq
+import re
+import base64
+import sys
+import threading
+import functools
+import gzip
+import hashlib
+import tempfile
+import stat
+import importlib
+import importlib.util
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import quote
+from datetime import datetime, date, timedelta, timezone
+from flask import Flask, request, jsonify, send_from_directory, send_file, Response, g, has_request_context
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit, join_room, leave_room
 from werkzeug.exceptions import HTTPException
-from google import genai
-from google.genai import types
+try:
+    import fcntl
+except ImportError:  # Windows: no forked workers to share metrics between
+    fcntl = None
 
 # --- Path Configuration ---
 # Get the absolute path to the directory containing this file
@@ -23,19 +42,22 @@ BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 FRONTEND_DIR = os.path.join(BASE_DIR, 'frontend')
 # Define path to index.html
 INDEX_PATH = os.path.join(BASE_DIR, 'index.html')
+LOGO_FILENAME = 'playsoullogo.png'
 
 # --- Env Vars ---
 API_KEY = os.environ.get("APIKEY", "").strip()
 OPENROUTER_KEY = os.environ.get("OPENROUTERKEY", "").strip()
+OPENROUTER_URL = os.environ.get("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions").strip()
+GEMINI_BASE_URL = os.environ.get("GEMINI_BASE_URL", "").strip() # Override for local stand-ins (see bench/)
 SUPABASE_URL = os.environ.get("DATABASE_URL", "").strip()
 SUPABASE_SERVICE_ROLE_KEY = os.environ.get("DATABASE_KEY", "").strip() # Secret Service Role Key
 SUPABASE_ANON_KEY = os.environ.get("SUPABASE_ANON_KEY", "").strip() # Public Anon Key
 ADMIN_USERNAME = "homelessman"
 
 # --- App Setup ---
-# static_folder points to the frontend directory
-app = Flask(__name__, static_folder=FRONTEND_DIR, static_url_path='/frontend')
-CORS(app)
+# The frontend directory is served by serve_frontend_asset (see Static Assets)
+app = Flask(__name__, static_folder=None)
+CORS(app, expose_headers=["X-Next-Cursor", "Server-Timing"])
 
 # --- SocketIO Setup ---
 # Allow all origins for the generated iframe scripts to connect
@@ -43,21 +65,777 @@ socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
 
 mimetypes.add_type('application/javascript', '.js')
 
-# Initialize Gemini
+# --- Lazy Initialisation ---
+# Worker boot only pays for what it serves: google.genai (the slowest import by
+# far), the optional compressors, Pillow and the static manifest are loaded on
+# first use. Set PRELOAD_APP=1 (with gunicorn --preload) to build all of it once
+# in the master instead, so forked workers share it copy-on-write.
+PRELOAD_APP = os.environ.get("PRELOAD_APP", "").strip() == "1"
+MISSING_MODULES = set()
+
+def lazy_import(name):
+    """Imports `name` on first use; returns None if it is not installed."""
+    if name in MISSING_MODULES:
+        return None
+    try:
+        # Cheap once loaded; the import system serialises concurrent first imports
+        return importlib.import_module(name)
+    except ImportError:
+        MISSING_MODULES.add(name)
+        return None
+
+def module_available(name):
+    """True if `name` can be imported, without importing it."""
+    try:
+        return name in sys.modules or importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+def once(factory):
+    """Wraps a zero-argument factory so it runs once, on first call, thread-safely."""
+    lock = threading.Lock()
+    result = []
+
+    @functools.wraps(factory)
+    def get():
+        if not result:
+            with lock:
+                if not result:
+                    result.append(factory())
+        return result[0]
+    return get
+
+# Initialize Gemini on first generation
 ai_client = None
-if API_KEY:
+ai_client_lock = threading.Lock()
+
+def get_ai_client():
+    global ai_client
+    if ai_client is None and API_KEY:
+        with ai_client_lock:
+            if ai_client is None:
+                try:
+                    from google import genai
+                    http_options = {"base_url": GEMINI_BASE_URL} if GEMINI_BASE_URL else None
+                    ai_client = genai.Client(api_key=API_KEY, http_options=http_options)
+                except Exception as e:
+                    print(f"Gemini Init Error: {e}")
+    return ai_client
+
+# --- Metrics ---
+# Prometheus text-format metrics, kept in-process and rendered on /metrics.
+# Each observation is a dict lookup and a few additions under a lock, so the
+# hot path stays cheap. Set METRICS_TOKEN to require a bearer token on scrape.
+# With several workers, set METRICS_DIR to a directory private to the app: each
+# worker writes its series there every METRICS_FLUSH_SECONDS and /metrics sums
+# all of them, so a scrape reaching any worker sees the whole server. Gauges
+# count only from workers that are alive and still flushing (a recycled pid
+# does not revive a dead worker's file). Counters and histograms of exited
+# workers are folded into one file and their own files deleted, so the
+# directory stays as small as the worker pool.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "").strip()
+METRICS_DIR = os.environ.get("METRICS_DIR", "").strip()
+METRICS_FLUSH_SECONDS = 5
+# Past this a file's gauges are dropped; past METRICS_DEAD_SECONDS it is folded even if its pid is in use
+METRICS_STALE_SECONDS = METRICS_FLUSH_SECONDS * 3
+METRICS_DEAD_SECONDS = 300
+METRICS_EXITED_FILE = "exited.json"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, doc, labels=()):
+        self.name = name
+        self.doc = doc
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def snapshot(self):
+        """JSON-serializable [[label values], value] pairs."""
+        with self._lock:
+            return [[list(label_values), value] for label_values, value in self._values.items()]
+
+    def merge(self, totals, snapshot):
+        for label_values, value in snapshot:
+            key = tuple(label_values)
+            totals[key] = totals.get(key, 0) + value
+
+    def items(self):
+        with self._lock:
+            return list(self._values.items())
+
+    def render(self, items=None):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+        for label_values, value in (self.items() if items is None else items):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, *label_values, value):
+        with self._lock:
+            self._values[label_values] = value
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, doc, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = self._values[label_values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(label_values), list(series)] for label_values, series in self._values.items()]
+
+    def merge(self, totals, snapshot):
+        for label_values, series in snapshot:
+            key = tuple(label_values)
+            current = totals.get(key)
+            totals[key] = list(series) if current is None else [a + b for a, b in zip(current, series)]
+
+    def items(self):
+        with self._lock:
+            return [(k, list(v)) for k, v in self._values.items()]
+
+    def render(self, items=None):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        if items is None:
+            items = self.items()
+        label_names = self.labels + ("le",)
+        for label_values, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                labels = _format_labels(label_names, label_values + (bound,))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {series[-1]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+HTTP_REQUEST_SECONDS = Histogram("playsoul_http_request_duration_seconds", "Flask request latency by route and status.", ("method", "route", "status"))
+UPSTREAM_SECONDS = Histogram("playsoul_upstream_request_duration_seconds", "Upstream call latency by target.", ("target", "method"))
+UPSTREAM_ERRORS = Counter("playsoul_upstream_errors_total", "Upstream calls that failed or returned an error status.", ("target", "kind"))
+CACHE_REQUESTS = Counter("playsoul_cache_requests_total", "Cache lookups by cache and result.", ("cache", "result"))
+GENERATIONS_IN_PROGRESS = Gauge("playsoul_generations_in_progress", "Generation requests currently waiting on a model or the DB insert.")
+SOCKET_CONNECTIONS = Gauge("playsoul_socketio_connections", "Open Socket.IO connections.")
+SOCKET_ROOMS = Gauge("playsoul_socketio_rooms", "Socket.IO rooms with at least one member.")
+GENERATED_CODE_BYTES = Counter("playsoul_generated_code_bytes_total", "Generated cart code size before and after post-processing, by stage.", ("stage",))
+SOCKET_MESSAGES = Counter("playsoul_socketio_messages_total", "Socket.IO events received, by event name. Use rate() for message rate.", ("event",))
+ALL_METRICS = (
+    HTTP_REQUEST_SECONDS, UPSTREAM_SECONDS, UPSTREAM_ERRORS, CACHE_REQUESTS,
+    GENERATIONS_IN_PROGRESS, GENERATED_CODE_BYTES, SOCKET_CONNECTIONS, SOCKET_ROOMS, SOCKET_MESSAGES,
+)
+
+GENERATIONS_IN_PROGRESS.set(value=0)
+SOCKET_CONNECTIONS.set(value=0)
+SOCKET_ROOMS.set(value=0)
+
+def pid_alive(pid):
     try:
-        ai_client = genai.Client(api_key=API_KEY)
-    except Exception as e:
-        print(f"Gemini Init Error: {e}")
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class MetricsExporter:
+    """Shares this worker's metrics with the other workers through files in `directory`."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._pid = None
+        self._path = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def ensure_started(self):
+        """Starts the flush thread once per process (workers are forked after import)."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            # pid for liveness, plus a random suffix so a recycled pid never overwrites a dead worker's counters
+            self._path = os.path.join(self.directory, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.json")
+            self._pid = os.getpid()
+        threading.Thread(target=self.run, name="metrics-flush", daemon=True).start()
+
+    def flush(self):
+        # Scrapes flush from request threads while the flush thread runs, so serialise
+        with self._flush_lock:
+            data = {metric.name: metric.snapshot() for metric in ALL_METRICS}
+            tmp_path = self._path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self._path)
+
+    def run(self):
+        while True:
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Metrics Flush Error: {e}")
+            time.sleep(METRICS_FLUSH_SECONDS)
+
+    @contextmanager
+    def locked(self):
+        """Serialises scrapes across workers, so a dead worker's file is folded exactly once."""
+        with open(os.path.join(self.directory, ".lock"), "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            # Closing the file releases the lock
+            yield
+
+    def collect(self):
+        """[(live, {metric name: snapshot})] per worker file, this one freshly flushed, plus exited workers' totals."""
+        self.ensure_started()
+        self.flush()
+        with self.locked():
+            snapshots, exited = [], []
+            now = time.time()
+            for filename in os.listdir(self.directory):
+                if not filename.endswith(('.json', '.json.tmp')) or filename == METRICS_EXITED_FILE:
+                    continue
+                path = os.path.join(self.directory, filename)
+                try:
+                    pid = int(filename.split('-', 1)[0])
+                    age = now - os.stat(path).st_mtime
+                except (OSError, ValueError):
+                    continue
+                if path != self._path and (not pid_alive(pid) or age > METRICS_DEAD_SECONDS):
+                    exited.append(path)
+                    continue
+                if filename.endswith('.tmp'):
+                    continue
+                try:
+                    with open(path) as f:
+                        data = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                snapshots.append((pid_alive(pid) and age <= METRICS_STALE_SECONDS, data))
+            totals = self.fold_exited(exited)
+        if totals:
+            snapshots.append((False, totals))
+        return snapshots
+
+    def fold_exited(self, paths):
+        """Adds the counters and histograms in `paths` to the exited-workers file, deletes them, returns its contents."""
+        exited_path = os.path.join(self.directory, METRICS_EXITED_FILE)
+        try:
+            with open(exited_path) as f:
+                totals = json.load(f)
+        except (OSError, ValueError):
+            totals = {}
+        if not paths:
+            return totals
+        folded = []
+        for path in paths:
+            if not path.endswith('.json'):
+                # A flush interrupted by the worker exiting
+                continue
+            try:
+                with open(path) as f:
+                    folded.append(json.load(f))
+            except (OSError, ValueError):
+                pass
+        for metric in ALL_METRICS:
+            if metric.kind == "gauge":
+                continue
+            merged = {}
+            for data in [totals] + folded:
+                metric.merge(merged, data.get(metric.name, []))
+            totals[metric.name] = [[list(label_values), value] for label_values, value in merged.items()]
+        tmp_path = exited_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(totals, f)
+        os.replace(tmp_path, exited_path)
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return totals
+
+METRICS_EXPORTER = MetricsExporter(METRICS_DIR) if METRICS_DIR else None
+
+def render_metrics():
+    snapshots = METRICS_EXPORTER.collect() if METRICS_EXPORTER else None
+    lines = []
+    for metric in ALL_METRICS:
+        if snapshots is None:
+            lines.extend(metric.render())
+            continue
+        totals = {}
+        for alive, data in snapshots:
+            if alive or metric.kind != "gauge":
+                metric.merge(totals, data.get(metric.name, []))
+        lines.extend(metric.render(list(totals.items())))
+    return "\n".join(lines) + "\n"
+
+# --- Request Timing ---
+# Named spans collected per request and emitted as a Server-Timing header.
+# Set TIMING_LOG=1 to also print one JSON line per request with the breakdown.
+SERVER_TIMING_ENABLED = os.environ.get("SERVER_TIMING", "1").strip() != "0"
+TIMING_LOG_ENABLED = os.environ.get("TIMING_LOG", "").strip() == "1"
+
+def record_span(name, seconds):
+    if not has_request_context():
+        return
+    spans = g.get('spans')
+    if spans is None:
+        spans = g.spans = {}
+    spans[name] = spans.get(name, 0.0) + seconds
+
+@contextmanager
+def span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - start)
+
+def timed(name):
+    """Decorator form of span() for whole functions."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def format_server_timing(spans, total):
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in spans.items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+# --- Sampling Profiler ---
+# Started on demand from /api/admin/profile. Nothing runs until then, so the
+# steady-state cost is zero. Output is in the folded-stack format accepted by
+# flamegraph.pl, speedscope and inferno.
+PROFILE_MAX_SECONDS = 60
+
+class SamplingProfiler:
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def run(self, seconds, interval):
+        """Samples every thread's stack for `seconds` and returns folded stacks, or None if busy."""
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            stacks = {}
+            ignore = {threading.get_ident()}
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id in ignore:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                        frame = frame.f_back
+                    key = ";".join(reversed(stack))
+                    stacks[key] = stacks.get(key, 0) + 1
+                time.sleep(interval)
+            return "".join(f"{key} {count}\n" for key, count in sorted(stacks.items()))
+        finally:
+            self._lock.release()
+
+profiler = SamplingProfiler()
+
+# Room membership for the room gauge. Key: room, Value: set of sids
+SOCKET_ROOM_MEMBERS = {}
+# Reverse index so disconnect only touches the sid's own rooms. Key: sid, Value: set of rooms
+SOCKET_SID_ROOMS = {}
+SOCKET_ROOM_LOCK = threading.Lock()
+
+# --- Cache Backends ---
+# Every shared cache (auth, feeds, carts) goes through a CacheBackend so that
+# gunicorn workers can share one copy. CACHE_BACKEND picks the implementation:
+#   memory - per-process LRU (default)
+#   sqlite - one SQLite file (CACHE_SQLITE_PATH) shared by all workers on the host
+# Values must be JSON-serializable. get_or_load() is single-flight within a
+# process; the SQLite backend also takes a short lease so that only one worker
+# loads a given key at a time. Loaders may return None for "does not exist",
+# which is cached for NEGATIVE_CACHE_TTL.
+# The SQLite file holds the auth cache, which decides who is admin, so it must
+# live in a directory only this user can write, and is created 0600.
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory").strip().lower()
+
+def default_cache_path():
+    owner = os.geteuid() if hasattr(os, "geteuid") else "user"
+    return os.path.join(tempfile.gettempdir(), f"playsoul-cache-{owner}", "cache.sqlite3")
+
+CACHE_SQLITE_PATH = os.environ.get("CACHE_SQLITE_PATH", "").strip() or default_cache_path()
+NEGATIVE_CACHE_TTL = 10
+CACHE_LEASE_SECONDS = 10
+
+class CacheFlight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+        self.invalidated = False
+
+class CacheBackend(ABC):
+    MISSING = object()
+
+    def __init__(self, name, max_entries, ttl):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+
+    @abstractmethod
+    def get(self, key):
+        """Returns the cached value, or MISSING."""
+
+    @abstractmethod
+    def set(self, key, value, ttl=None):
+        pass
+
+    @abstractmethod
+    def add(self, key, value, ttl=None):
+        """Stores value only if key is absent or expired; returns whichever value is now cached."""
+
+    @abstractmethod
+    def delete(self, key):
+        pass
+
+    def entry_ttl(self, value, ttl):
+        if ttl is not None:
+            return ttl
+        return self.ttl if value is not None else min(self.ttl, NEGATIVE_CACHE_TTL)
+
+    def invalidate(self, key):
+        self.delete(key)
+        with self._inflight_lock:
+            flight = self._inflight.get(key)
+            if flight is not None:
+                flight.invalidated = True
+
+    def load_shared(self, key, loader, ttl):
+        """Runs loader on a local miss. Backends shared across processes coordinate here."""
+        value = loader()
+        return value, True
+
+    def get_or_load(self, key, loader, ttl=None):
+        value = self.get(key)
+        if value is not self.MISSING:
+            CACHE_REQUESTS.inc(self.name, "hit")
+            return value
+        CACHE_REQUESTS.inc(self.name, "miss")
+
+        with self._inflight_lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = CacheFlight()
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            value, fresh = self.load_shared(key, loader, ttl)
+            # Skip storing if the key was invalidated while we were loading
+            if fresh and not flight.invalidated:
+                value = self.add(key, value, ttl)
+            flight.value = value
+            return value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+            flight.event.set()
+
+class MemoryCache(CacheBackend):
+    """Per-process LRU with per-entry expiry."""
+
+    def __init__(self, name, max_entries, ttl):
+        super().__init__(name, max_entries, ttl)
+        # Key -> (value, expires_at)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return self.MISSING
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return self.MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.entry_ttl(value, ttl))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def add(self, key, value, ttl=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                return entry[0]
+        self.set(key, value, ttl)
+        return value
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+class SQLiteCache(CacheBackend):
+    """Cache rows in a local SQLite file shared by every worker process.
+
+    Eviction beyond max_entries is oldest-first and runs every PRUNE_EVERY writes.
+    """
+    PRUNE_EVERY = 200
+    _schema_ready = set()
+    _checked_paths = set()
+    _local = threading.local()
+
+    def __init__(self, name, max_entries, ttl, path=CACHE_SQLITE_PATH):
+        super().__init__(name, max_entries, ttl)
+        self.path = path
+        self._writes = 0
+        if path not in self._checked_paths:
+            prepare_private_file(path)
+            self._checked_paths.add(path)
+
+    def connection(self):
+        # One connection per thread, and never one inherited across fork()
+        conns = getattr(self._local, 'conns', None)
+        if conns is None or self._local.pid != os.getpid():
+            conns = self._local.conns = {}
+            self._local.pid = os.getpid()
+        conn = conns.get(self.path)
+        if conn is None:
+            import sqlite3
+            conn = conns[self.path] = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if self.path not in self._schema_ready:
+                conn.execute("CREATE TABLE IF NOT EXISTS cache (name TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL NOT NULL, stored_at REAL NOT NULL, PRIMARY KEY (name, key))")
+                conn.execute("CREATE INDEX IF NOT EXISTS cache_stored_at ON cache (name, stored_at)")
+                conn.execute("CREATE TABLE IF NOT EXISTS cache_leases (name TEXT NOT NULL, key TEXT NOT NULL, expires_at REAL NOT NULL, PRIMARY KEY (name, key))")
+                self._schema_ready.add(self.path)
+        return conn
+
+    def get(self, key):
+        row = self.connection().execute(
+            "SELECT value FROM cache WHERE name = ? AND key = ? AND expires_at > ?",
+            (self.name, key, time.time())
+        ).fetchone()
+        if row is None:
+            return self.MISSING
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        self.connection().execute(
+            "INSERT OR REPLACE INTO cache (name, key, value, expires_at, stored_at) VALUES (?, ?, ?, ?, ?)",
+            (self.name, key, json.dumps(value), now + self.entry_ttl(value, ttl), now)
+        )
+        self.after_write()
+
+    def add(self, key, value, ttl=None):
+        now = time.time()
+        conn = self.connection()
+        # Replace only a missing or expired row, atomically; then read back the winner
+        conn.execute(
+            "INSERT INTO cache (name, key, value, expires_at, stored_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (name, key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at, stored_at = excluded.stored_at "
+            "WHERE cache.expires_at <= ?",
+            (self.name, key, json.dumps(value), now + self.entry_ttl(value, ttl), now, now)
+        )
+        self.after_write()
+        stored = self.get(key)
+        return value if stored is self.MISSING else stored
+
+    def delete(self, key):
+        self.connection().execute("DELETE FROM cache WHERE name = ? AND key = ?", (self.name, key))
+
+    def after_write(self):
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY:
+            return
+        conn = self.connection()
+        conn.execute("DELETE FROM cache WHERE name = ? AND expires_at <= ?", (self.name, time.time()))
+        conn.execute(
+            "DELETE FROM cache WHERE name = ? AND key IN (SELECT key FROM cache WHERE name = ? ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+            (self.name, self.name, self.max_entries)
+        )
+
+    def take_lease(self, key):
+        now = time.time()
+        cursor = self.connection().execute(
+            "INSERT INTO cache_leases (name, key, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (name, key) DO UPDATE SET expires_at = excluded.expires_at WHERE cache_leases.expires_at <= ?",
+            (self.name, key, now + CACHE_LEASE_SECONDS, now)
+        )
+        return cursor.rowcount > 0
+
+    def lease_held(self, key):
+        return self.connection().execute(
+            "SELECT 1 FROM cache_leases WHERE name = ? AND key = ? AND expires_at > ?",
+            (self.name, key, time.time())
+        ).fetchone() is not None
+
+    def load_shared(self, key, loader, ttl):
+        # Another worker may hold the lease: wait for its result. If it lets go
+        # without storing one (its loader failed, or the key was invalidated),
+        # take the lease over instead of waiting out CACHE_LEASE_SECONDS.
+        deadline = time.monotonic() + CACHE_LEASE_SECONDS
+        while True:
+            if self.take_lease(key):
+                try:
+                    return loader(), True
+                finally:
+                    self.connection().execute("DELETE FROM cache_leases WHERE name = ? AND key = ?", (self.name, key))
+            while self.lease_held(key):
+                if time.monotonic() >= deadline:
+                    return loader(), True
+                time.sleep(0.02)
+                value = self.get(key)
+                if value is not self.MISSING:
+                    return value, False
+            value = self.get(key)
+            if value is not self.MISSING:
+                return value, False
+
+def prepare_private_file(path):
+    """Creates `path` (0600) in a 0700 directory if needed; refuses files other users could read or plant."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    check_owner = hasattr(os, "geteuid")
+    if check_owner:
+        dir_stat = os.lstat(directory)
+        if not stat.S_ISDIR(dir_stat.st_mode) or dir_stat.st_uid != os.geteuid() or dir_stat.st_mode & 0o022:
+            raise RuntimeError(f"Cache directory {directory} must be owned by this user and not writable by others")
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, "O_NOFOLLOW", 0), 0o600)
+    try:
+        file_stat = os.fstat(fd)
+    finally:
+        os.close(fd)
+    if check_owner and (file_stat.st_uid != os.geteuid() or file_stat.st_mode & 0o077):
+        raise RuntimeError(f"Cache file {path} must be owned by this user with mode 0600")
+
+def make_cache(name, max_entries, ttl):
+    if CACHE_BACKEND == "sqlite":
+        return SQLiteCache(name, max_entries, ttl)
+    return MemoryCache(name, max_entries, ttl)
 
 # --- Auth Cache ---
-# Simple in-memory cache to prevent hitting Supabase Rate Limits on every request
-# Key: Token, Value: (User Object, Timestamp)
-AUTH_CACHE = {}
+# Prevents hitting Supabase Rate Limits on every request
+# Key: SHA-256 of the token, Value: User Object
 AUTH_CACHE_TTL = 60 # 1 minute
+AUTH_CACHE = make_cache("auth", int(os.environ.get("AUTH_CACHE_SIZE", "10000")), ttl=AUTH_CACHE_TTL)
 
 # --- Helpers ---
+def classify_upstream(url):
+    """Maps an outgoing URL to the upstream target label used in metrics."""
+    if url.startswith(OPENROUTER_URL) or "openrouter.ai" in url:
+        return "openrouter"
+    if SUPABASE_URL and url.startswith(SUPABASE_URL):
+        if url.startswith(f"{SUPABASE_URL}/auth/v1/"):
+            return "supabase_auth"
+        return "supabase_rest"
+    return "other"
+
+@contextmanager
+def track_upstream(target, method):
+    """Times an upstream call and counts it as an error if it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        UPSTREAM_ERRORS.inc(target, type(e).__name__)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        UPSTREAM_SECONDS.observe(elapsed, target, method)
+        record_span(target, elapsed)
+
+class UpstreamClient:
+    """Drop-in for the `requests` helpers that records latency and errors per upstream target."""
+
+    def request(self, method, url, **kwargs):
+        target = classify_upstream(url)
+        with track_upstream(target, method):
+            resp = requests.request(method, url, **kwargs)
+        if resp.status_code >= 400:
+            UPSTREAM_ERRORS.inc(target, f"http_{resp.status_code}")
+        return resp
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request("HEAD", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request("PATCH", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+upstream = UpstreamClient()
+
 def get_db_headers():
     return {
         "apikey": SUPABASE_SERVICE_ROLE_KEY,
@@ -79,8 +857,9 @@ def update_credits(user_id, new_credits, reset_date=None):
     if reset_date:
         payload["last_reset_date"] = str(reset_date)
         
-    requests.patch(url, json=payload, headers=get_db_headers())
+    upstream.patch(url, json=payload, headers=get_db_headers())
 
+@timed("auth")
 def verify_token(req):
     auth_header = req.headers.get('Authorization')
     if not auth_header:
@@ -88,100 +867,96 @@ def verify_token(req):
     
     token = auth_header.split(" ")[1] if " " in auth_header else auth_header
     
-    # Check Cache
-    now = time.time()
-    if token in AUTH_CACHE:
-        cached_user, timestamp = AUTH_CACHE[token]
-        if now - timestamp < AUTH_CACHE_TTL:
-            return cached_user
-        else:
-            del AUTH_CACHE[token]
-    
     if not SUPABASE_URL or not SUPABASE_ANON_KEY:
         print("Error: Missing Supabase Config")
         return None
 
+    # Concurrent first requests with one token (a page load fires several) share a single lookup
+    cache_key = hashlib.sha256(token.encode()).hexdigest()
+    try:
+        return AUTH_CACHE.get_or_load(cache_key, lambda: load_user(token))
+    except Exception as e:
+        if str(e) == "Upstream Auth Rate Limit":
+            raise HTTPException(description="Too Many Requests (Auth Provider)", response=Response("Too Many Requests", status=429))
+        print(f"Auth verification failed: {e}")
+    
+    return None
+
+def load_user(token):
+    """The user and profile behind a token, or None if Supabase rejects it.
+
+    Raises on rate limits, upstream errors and transport failures so those are not cached as "no user".
+    """
     url = f"{SUPABASE_URL}/auth/v1/user"
     headers = {
         "apikey": SUPABASE_ANON_KEY,
         "Authorization": f"Bearer {token}"
     }
     
-    try:
-        response = requests.get(url, headers=headers, timeout=5)
+    response = upstream.get(url, headers=headers, timeout=5)
+    
+    if response.status_code == 429:
+        print(f"Supabase Auth Rate Limit Hit: {response.text}")
+        raise Exception("Upstream Auth Rate Limit")
+    if response.status_code >= 500:
+        raise Exception(f"Auth provider error: {response.status_code}")
+    if response.status_code != 200:
+        return None
+
+    user = response.json()
+    user_id = user['id']
+    
+    # Fetch Profile Data (Banned status + Credits + Username + Avatar)
+    profile_url = f"{SUPABASE_URL}/rest/v1/profiles?id=eq.{user_id}&select=is_banned,credits,last_reset_date,username,avatar_url"
+    prof_resp = upstream.get(profile_url, headers=get_db_headers())
+    
+    is_banned = False
+    credits = 15
+    last_reset = None
+    username = user.get('user_metadata', {}).get('username', 'Operator')
+    avatar_url = None
+    
+    if prof_resp.status_code == 200 and prof_resp.json():
+        profile = prof_resp.json()[0]
+        is_banned = profile.get('is_banned', False)
+        credits = profile.get('credits', 15)
+        last_reset_str = profile.get('last_reset_date')
+        username = profile.get('username') or username
+        avatar_url = profile.get('avatar_url')
         
-        if response.status_code == 200:
-            user = response.json()
-            user_id = user['id']
-            
-            # Fetch Profile Data (Banned status + Credits + Username + Avatar)
-            profile_url = f"{SUPABASE_URL}/rest/v1/profiles?id=eq.{user_id}&select=is_banned,credits,last_reset_date,username,avatar_url"
-            prof_resp = requests.get(profile_url, headers=get_db_headers())
-            
-            is_banned = False
-            credits = 15
-            last_reset = None
-            username = user.get('user_metadata', {}).get('username', 'Operator')
-            avatar_url = None
-            
-            if prof_resp.status_code == 200 and prof_resp.json():
-                profile = prof_resp.json()[0]
-                is_banned = profile.get('is_banned', False)
-                credits = profile.get('credits', 15)
-                last_reset_str = profile.get('last_reset_date')
-                username = profile.get('username') or username
-                avatar_url = profile.get('avatar_url')
-                
-                # Check for Daily Reset
-                today = date.today()
-                if last_reset_str != str(today):
-                    if credits < 15:
-                        credits = 15
-                        update_credits(user_id, 15, reset_date=today)
-                    else:
-                        update_credits(user_id, credits, reset_date=today)
+        # Check for Daily Reset
+        today = date.today()
+        if last_reset_str != str(today):
+            if credits < 15:
+                credits = 15
+                update_credits(user_id, 15, reset_date=today)
             else:
-                # Profile missing? Create it.
-                create_url = f"{SUPABASE_URL}/rest/v1/profiles"
-                requests.post(create_url, json={
-                    "id": user_id,
-                    "username": username,
-                    "credits": 15,
-                    "last_reset_date": str(date.today())
-                }, headers=get_db_headers())
-            
-            user['is_banned'] = is_banned
-            user['credits'] = credits
-            user['username'] = username
-            user['avatar_url'] = avatar_url
-            
-            # Check Admin status
-            user['is_admin'] = (username == ADMIN_USERNAME)
-            
-            # Cache the result
-            AUTH_CACHE[token] = (user, now)
-            
-            return user
-        elif response.status_code == 429:
-            print(f"Supabase Auth Rate Limit Hit: {response.text}")
-            raise Exception("Upstream Auth Rate Limit")
-        else:
-             pass
-
-    except Exception as e:
-        if str(e) == "Upstream Auth Rate Limit":
-            raise HTTPException(description="Too Many Requests (Auth Provider)", response=Response("Too Many Requests", status=429))
-        print(f"Auth verification failed: {e}")
+                update_credits(user_id, credits, reset_date=today)
+    else:
+        # Profile missing? Create it.
+        create_url = f"{SUPABASE_URL}/rest/v1/profiles"
+        upstream.post(create_url, json={
+            "id": user_id,
+            "username": username,
+            "credits": 15,
+            "last_reset_date": str(date.today())
+        }, headers=get_db_headers())
     
-    return None
+    user['is_banned'] = is_banned
+    user['credits'] = credits
+    user['username'] = username
+    user['avatar_url'] = avatar_url
+    
+    # Check Admin status
+    user['is_admin'] = (username == ADMIN_USERNAME)
+    
+    return user
 
 def serve_html_with_meta(title=None, description=None):
-    if not os.path.exists(INDEX_PATH):
+    html_content = index_html()
+    if html_content is None:
         return "Index file not found.", 404
 
-    with open(INDEX_PATH, 'r') as f:
-        html_content = f.read()
-
     default_title = "PlaySOUL | AI Game Generation Platform"
     default_desc = "Generate your digital reality. AI-powered single-file web app generator using Gemini 3.0."
     
@@ -194,12 +969,768 @@ def serve_html_with_meta(title=None, description=None):
     
     return html_content
 
+# --- Static Assets ---
+# Everything under frontend/ is read, hashed and precompressed once, on first
+# use (or at startup with PRELOAD_APP). Each file is also reachable as
+# name.<hash>.ext; those URLs are immutable and cached for a year, while plain
+# URLs revalidate against the ETag.
+# brotli and Pillow are optional: without them only gzip and the original logo are served.
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+LOGO_CACHE_CONTROL = "public, max-age=86400"
+FINGERPRINT_LENGTH = 10
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+LOGO_WIDTHS = (64, 128, 256, 512)
+
+class StaticAsset:
+    def __init__(self, relpath, body, mimetype, precompressed):
+        self.relpath = relpath
+        self.mimetype = mimetype
+        digest = hashlib.sha256(body).hexdigest()
+        self.fingerprint = digest[:FINGERPRINT_LENGTH]
+        self.etag = digest[:32]
+        # Content-Encoding -> bytes; None is the identity encoding
+        self.variants = {None: body}
+        self.variants.update(precompressed)
+
+    def fingerprinted_path(self):
+        root, ext = os.path.splitext(self.relpath)
+        return f"{root}.{self.fingerprint}{ext}"
+
+def compress_static(body, mimetype, path):
+    """Returns {encoding: bytes}, preferring .br/.gz files built next to the source."""
+    variants = {}
+    if not mimetype.startswith(COMPRESSIBLE_TYPES) or len(body) < 256:
+        return variants
+    for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+        if os.path.exists(path + suffix):
+            with open(path + suffix, 'rb') as f:
+                variants[encoding] = f.read()
+    if "gzip" not in variants:
+        variants["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+    brotli = lazy_import("brotli")
+    if "br" not in variants and brotli is not None:
+        variants["br"] = brotli.compress(body, quality=11)
+    return {k: v for k, v in variants.items() if len(v) < len(body)}
+
+def build_static_manifest(root):
+    """Indexes every file under `root` by relative path and by fingerprinted path."""
+    manifest = {}
+    if not os.path.isdir(root):
+        return manifest
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.endswith(('.br', '.gz')):
+                continue
+            path = os.path.join(dirpath, filename)
+            relpath = os.path.relpath(path, root).replace(os.sep, '/')
+            with open(path, 'rb') as f:
+                body = f.read()
+            mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            asset = StaticAsset(relpath, body, mimetype, compress_static(body, mimetype, path))
+            manifest[relpath] = asset
+            manifest[asset.fingerprinted_path()] = asset
+    return manifest
+
+def asset_url(relpath):
+    """Fingerprinted URL for a frontend file, or the plain URL if it is unknown."""
+    asset = static_assets().get(relpath)
+    if asset is None:
+        return f"/frontend/{relpath}"
+    return f"/frontend/{asset.fingerprinted_path()}"
+
+def load_index_html():
+    if not os.path.exists(INDEX_PATH):
+        return None
+    with open(INDEX_PATH, 'r') as f:
+        html_content = f.read()
+    return html_content.replace('src="/frontend/index.js"', f'src="{asset_url("index.js")}"')
+
+def send_static_variant(variants, mimetype, etag, cache_control, vary):
+    """Serves the best encoding the client accepts, with a per-encoding strong ETag."""
+    encoding = None
+    for candidate in ("br", "gzip"):
+        if candidate in variants and request.accept_encodings[candidate] > 0:
+            encoding = candidate
+            break
+    response = Response(variants[encoding], mimetype=mimetype)
+    response.set_etag(f"{etag}-{encoding}" if encoding else etag)
+    response.headers['Cache-Control'] = cache_control
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add(vary)
+    return response.make_conditional(request)
+
+def find_logo_path():
+    for candidate in (os.path.join(BASE_DIR, LOGO_FILENAME), os.path.join(FRONTEND_DIR, LOGO_FILENAME)):
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+def load_logo():
+    path = find_logo_path()
+    if path is None:
+        return None
+    with open(path, 'rb') as f:
+        return f.read()
+
+# Key: (width or None, format), Value: (bytes, mimetype, etag)
+LOGO_VARIANTS = {}
+LOGO_VARIANTS_LOCK = threading.Lock()
+
+@once
+def logo_formats():
+    """Image formats this server can encode, best first."""
+    if lazy_import("PIL.Image") is None:
+        return ()
+    pil_features = lazy_import("PIL.features")
+    return tuple(fmt for fmt in ("avif", "webp") if pil_features.check(fmt))
+
+def render_logo_variant(width, fmt):
+    """Encodes (and memoizes) the logo at `width` in `fmt`; falls back to the original PNG."""
+    key = (width, fmt)
+    variant = LOGO_VARIANTS.get(key)
+    if variant is not None:
+        return variant
+    with LOGO_VARIANTS_LOCK:
+        variant = LOGO_VARIANTS.get(key)
+        if variant is not None:
+            return variant
+        body, mimetype = logo_bytes(), 'image/png'
+        Image = lazy_import("PIL.Image")
+        if Image is not None and (width or fmt != 'png'):
+            try:
+                image = Image.open(io.BytesIO(body))
+                if width and width < image.width:
+                    image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+                out = io.BytesIO()
+                image.save(out, format=fmt.upper(), quality=80) if fmt != 'png' else image.save(out, format='PNG', optimize=True)
+                body, mimetype = out.getvalue(), f"image/{fmt}"
+            except Exception as e:
+                print(f"Logo variant error ({width}, {fmt}): {e}")
+        variant = LOGO_VARIANTS[key] = (body, mimetype, hashlib.sha256(body).hexdigest()[:32])
+        return variant
+
+@once
+def static_assets():
+    return build_static_manifest(FRONTEND_DIR)
+
+index_html = once(load_index_html)
+logo_bytes = once(load_logo)
+
+# --- Cart Cache ---
+# Cart metadata (everything but `code`) changes on rename, listing and view
+# counts, so it is cached briefly. `code` never changes after generation and
+# is cached for much longer. update_cart and delete_cart invalidate both.
+# Carts are selected by explicit column list, never *, so search_vector stays out of payloads
+CART_COLUMNS = "id,user_id,username,name,prompt,model,code,views,is_listed,created_at"
+CART_FEED_COLUMNS = f"{CART_COLUMNS},profiles(username,avatar_url)"
+CART_META_COLUMNS = "id,user_id,username,name,prompt,model,views,is_listed,created_at,profiles(username,avatar_url)"
+CART_META_CACHE = make_cache("cart_meta", int(os.environ.get("CART_META_CACHE_SIZE", "5000")), ttl=30)
+CART_CODE_CACHE = make_cache("cart_code", int(os.environ.get("CART_CODE_CACHE_SIZE", "500")), ttl=3600)
+
+def fetch_cart_meta(cart_id):
+    """Loads a cart's metadata as {"cart": row}, or None if it does not exist."""
+    url = f"{SUPABASE_URL}/rest/v1/carts?select={CART_META_COLUMNS}&id=eq.{cart_id}"
+    resp = upstream.get(url, headers=get_db_headers())
+    if resp.status_code != 200:
+        raise Exception(f"DB Error: {resp.text}")
+    data = resp.json()
+    if not data:
+        return None
+    return {"cart": data[0]}
+
+def fetch_cart_code(cart_id):
+    """Returns the stored `code` string for a cart, or None if it does not exist."""
+    url = f"{SUPABASE_URL}/rest/v1/carts?select=code&id=eq.{cart_id}"
+    resp = upstream.get(url, headers=get_db_headers())
+    if resp.status_code != 200:
+        raise Exception(f"DB Error: {resp.text}")
+    data = resp.json()
+    if not data:
+        return None
+    return data[0].get('code') or ''
+
+# --- Feed Cache ---
+# /api/carts responses are shared by every visitor, so even a short TTL removes
+# most feed queries. Keys are per sort mode and per user filter.
+FEED_CACHE = make_cache("feed", int(os.environ.get("FEED_CACHE_SIZE", "128")), ttl=int(os.environ.get("FEED_CACHE_TTL", "15")))
+FEED_SORT_MODES = ('recent', 'popular', 'trending')
+
+def feed_cache_key(sort_mode, user_id=None):
+    if sort_mode not in FEED_SORT_MODES:
+        sort_mode = 'recent'
+    return f"{sort_mode}:{user_id or ''}"
+
+def fetch_feed(url):
+    resp = upstream.get(url, headers=get_db_headers())
+    if resp.status_code != 200:
+        raise Exception(resp.text)
+    with span("json"):
+        return resp.json()
+
+def invalidate_feeds(user_id=None):
+    """Drops the global feeds and, if given, one user's feeds."""
+    for sort_mode in FEED_SORT_MODES:
+        FEED_CACHE.invalidate(feed_cache_key(sort_mode))
+        if user_id:
+            FEED_CACHE.invalidate(feed_cache_key(sort_mode, user_id))
+
+# --- Trending ---
+# Each listed cart carries an exponentially decayed view score with half-life
+# TRENDING_HALF_LIFE_HOURS. A view at time t adds exp(decay * (t - epoch)), so
+# stored scores never need rescaling as time passes: their order is the order
+# of the decayed scores at any instant. Views recorded by this process are
+# applied immediately. Every TRENDING_RECONCILE_SECONDS a background thread
+# pulls view counts from the DB and credits views seen by other workers. The
+# top-K list the endpoint serves is rebuilt every TRENDING_TOPK_SECONDS.
+TRENDING_HALF_LIFE_HOURS = float(os.environ.get("TRENDING_HALF_LIFE_HOURS", "24"))
+TRENDING_WINDOW_DAYS = int(os.environ.get("TRENDING_WINDOW_DAYS", "14"))
+TRENDING_MAX_CANDIDATES = 20000
+TRENDING_TOP_K = 50
+TRENDING_TOPK_SECONDS = 10
+TRENDING_RECONCILE_SECONDS = 300
+TRENDING_START_TIMEOUT = 30
+
+def parse_timestamp(value):
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+class TrendingIndex:
+    def __init__(self, half_life_hours, top_k):
+        self.decay = math.log(2) / (half_life_hours * 3600)
+        self.top_k = top_k
+        self.epoch = time.time()
+        # cart id -> decayed score, DB view count at last reconcile, views recorded here since then
+        self.scores = {}
+        self.db_views = {}
+        self.local_views = {}
+        self.top_ids = []
+        self.reconciled_at = None
+        self._lock = threading.Lock()
+        self._started = False
+        self._ready = threading.Event()
+
+    def weight(self, t):
+        return math.exp(self.decay * (t - self.epoch))
+
+    def spread_weight(self, start, end):
+        """Average weight of a view that happened at a uniformly random time in [start, end]."""
+        if end - start < 1:
+            return self.weight(end)
+        return (self.weight(end) - self.weight(start)) / (self.decay * (end - start))
+
+    def record_view(self, cart_id):
+        with self._lock:
+            if cart_id not in self.scores:
+                return
+            self.scores[cart_id] += self.weight(time.time())
+            self.local_views[cart_id] = self.local_views.get(cart_id, 0) + 1
+
+    def reconcile(self, rows):
+        """Merges a DB snapshot of (id, views, created_at) for every candidate cart."""
+        now = time.time()
+        with self._lock:
+            if self.decay * (now - self.epoch) > 50:
+                self.rebase(now)
+            previous = self.reconciled_at
+            scores, db_views = {}, {}
+            for row in rows:
+                cart_id, views = row['id'], row.get('views') or 0
+                db_views[cart_id] = views
+                if cart_id in self.scores and previous is not None:
+                    # Views other workers saw since the last snapshot, spread over that interval
+                    unseen = max(views - self.db_views.get(cart_id, 0) - self.local_views.get(cart_id, 0), 0)
+                    scores[cart_id] = self.scores[cart_id] + unseen * self.spread_weight(previous, now)
+                else:
+                    created = parse_timestamp(row['created_at'])
+                    scores[cart_id] = views * self.spread_weight(min(created, now), now)
+            self.scores, self.db_views, self.local_views = scores, db_views, {}
+            self.reconciled_at = now
+        self.refresh_top()
+
+    def rebase(self, now):
+        factor = math.exp(-self.decay * (now - self.epoch))
+        self.scores = {cart_id: score * factor for cart_id, score in self.scores.items()}
+        self.epoch = now
+
+    def refresh_top(self):
+        with self._lock:
+            items = list(self.scores.items())
+        self.top_ids = [cart_id for cart_id, _ in heapq.nlargest(self.top_k, items, key=lambda item: item[1])]
+
+    def ensure_started(self):
+        """Loads the first snapshot synchronously, then keeps it fresh from a daemon thread.
+
+        Concurrent first callers wait for that snapshot rather than reading an empty top-K.
+        """
+        with self._lock:
+            starting = not self._started
+            self._started = True
+        if not starting:
+            self._ready.wait(TRENDING_START_TIMEOUT)
+            return
+        try:
+            self.reconcile(fetch_trending_candidates())
+        except Exception as e:
+            print(f"Trending Load Error: {e}")
+        finally:
+            self._ready.set()
+        threading.Thread(target=self.run, name="trending", daemon=True).start()
+
+    def run(self):
+        while True:
+            time.sleep(TRENDING_TOPK_SECONDS)
+            try:
+                if self.reconciled_at is None or time.time() - self.reconciled_at >= TRENDING_RECONCILE_SECONDS:
+                    self.reconcile(fetch_trending_candidates())
+                else:
+                    self.refresh_top()
+            except Exception as e:
+                print(f"Trending Refresh Error: {e}")
+
+def fetch_trending_candidates():
+    since = (datetime.now(timezone.utc) - timedelta(days=TRENDING_WINDOW_DAYS)).strftime('%Y-%m-%dT%H:%M:%SZ')
+    url = (f"{SUPABASE_URL}/rest/v1/carts?select=id,views,created_at&is_listed=eq.true"
+           f"&created_at=gte.{since}&order=created_at.desc&limit={TRENDING_MAX_CANDIDATES}")
+    resp = upstream.get(url, headers=get_db_headers())
+    if resp.status_code != 200:
+        raise Exception(resp.text)
+    return resp.json()
+
+def fetch_carts_by_ids(cart_ids):
+    """Feed rows for the given ids, in the given order."""
+    if not cart_ids:
+        return []
+    url = f"{SUPABASE_URL}/rest/v1/carts?select={CART_FEED_COLUMNS}&is_listed=eq.true&id=in.({','.join(cart_ids)})"
+    rows = {row['id']: row for row in fetch_feed(url)}
+    return [rows[cart_id] for cart_id in cart_ids if cart_id in rows]
+
+TRENDING = TrendingIndex(TRENDING_HALF_LIFE_HOURS, TRENDING_TOP_K)
+
+# --- Search ---
+# Backed by the search_vector GIN index and the search_carts RPC (database.sql).
+# Every term is matched as a prefix, so "spa rac" finds "space racer".
+# Pages are keyed by (rank, id) and handed to clients as an opaque cursor.
+# The RPC ranks every match before taking a page, so cost grows with the match
+# count. A one- or two-letter prefix matches most listed carts, so terms
+# shorter than SEARCH_MIN_TERM_LENGTH are dropped.
+SEARCH_CACHE = make_cache("search", int(os.environ.get("SEARCH_CACHE_SIZE", "512")), ttl=30)
+SEARCH_MAX_TERMS = 8
+SEARCH_MIN_TERM_LENGTH = 3
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 50
+
+def build_search_query(text):
+    """Turns free text into a prefix-matching to_tsquery expression, or None if it has no terms."""
+    terms = [term for term in re.findall(r"[^\W_]+", text.lower()) if len(term) >= SEARCH_MIN_TERM_LENGTH][:SEARCH_MAX_TERMS]
+    if not terms:
+        return None
+    return " & ".join(f"{term}:*" for term in terms)
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on anything malformed."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
+
+def fetch_search_page(search_query, limit, after_rank, after_id):
+    url = f"{SUPABASE_URL}/rest/v1/rpc/search_carts"
+    payload = {"search_query": search_query, "result_limit": limit, "after_rank": after_rank, "after_id": after_id}
+    resp = upstream.post(url, json=payload, headers=get_db_headers())
+    if resp.status_code != 200:
+        raise Exception(resp.text)
+    return resp.json()
+
+def get_cart_meta(cart_id):
+    return CART_META_CACHE.get_or_load(cart_id, lambda: fetch_cart_meta(cart_id))
+
+def get_cart_code(cart_id):
+    return CART_CODE_CACHE.get_or_load(cart_id, lambda: fetch_cart_code(cart_id))
+
+def invalidate_cart(cart_id, code=False):
+    CART_META_CACHE.invalidate(cart_id)
+    if code:
+        CART_CODE_CACHE.invalidate(cart_id)
+        with CART_FILES_LOCK:
+            CART_FILES.pop(cart_id, None)
+
+def conditional_response(response):
+    """Adds an ETag to a 200 response and turns it into a 304 when the client is current.
+
+    No Last-Modified: carts have no change timestamp, and cache fill times differ per worker.
+    """
+    response.add_etag()
+    return response.make_conditional(request)
+
+# --- Cart Files ---
+# /run/<cart_id>/<filename> serves each generated file on its own. Cart code
+# never changes after generation, but carts can be deleted (e.g. for abuse), so
+# downstream caches keep files for CART_FILE_MAX_AGE and then revalidate by
+# ETag. The parsed, compressed file map is kept in a bounded LRU here for as
+# long as the cart_code cache would keep the code, and is only served while
+# the (briefly cached) cart metadata still exists.
+CART_FILES_CACHE_SIZE = int(os.environ.get("CART_FILES_CACHE_SIZE", "256"))
+CART_FILE_MAX_AGE = int(os.environ.get("CART_FILE_MAX_AGE", "300"))
+CART_FILE_CACHE_CONTROL = f"public, max-age={CART_FILE_MAX_AGE}"
+# Generated code is untrusted: run it in an opaque origin so it cannot read this site's storage or cookies
+CART_FILE_CSP = "sandbox allow-scripts allow-forms allow-modals allow-popups allow-pointer-lock"
+
+CART_FILES = OrderedDict()
+CART_FILES_LOCK = threading.Lock()
+
+def parse_cart_files(raw_code):
+    """Splits stored cart code into {filename: (variants, mimetype, etag)}."""
+    files = [{"name": "index.html", "content": raw_code}]
+    try:
+        json_structure = json.loads(raw_code)
+        if isinstance(json_structure, dict) and isinstance(json_structure.get('files'), list):
+            files = json_structure['files']
+    except json.JSONDecodeError:
+        pass
+
+    file_map = {}
+    for file_obj in files:
+        if not isinstance(file_obj, dict):
+            continue
+        name = str(file_obj.get('name') or 'unknown.txt').lstrip('/')
+        body = str(file_obj.get('content') or '').encode('utf-8')
+        mimetype = mimetypes.guess_type(name)[0] or 'text/plain'
+        variants = {None: body}
+        if mimetype.startswith(COMPRESSIBLE_TYPES) and len(body) >= COMPRESS_MIN_SIZE:
+            for encoding in ("br", "gzip"):
+                if encoding in RESPONSE_ENCODINGS:
+                    variants[encoding] = compress_body(body, encoding)
+        file_map[name] = (variants, mimetype, hashlib.sha256(body).hexdigest()[:32])
+    return file_map
+
+def get_cart_files(cart_id):
+    """Parsed file map for a cart from the LRU, loading it on a miss. None if the cart is missing."""
+    # Other workers may have deleted the cart; the metadata cache notices within its TTL
+    if get_cart_meta(cart_id) is None:
+        with CART_FILES_LOCK:
+            CART_FILES.pop(cart_id, None)
+        return None
+
+    with CART_FILES_LOCK:
+        entry = CART_FILES.get(cart_id)
+        if entry is not None and entry[1] <= time.monotonic():
+            del CART_FILES[cart_id]
+            entry = None
+        if entry is not None:
+            CART_FILES.move_to_end(cart_id)
+    if entry is not None:
+        CACHE_REQUESTS.inc("cart_files", "hit")
+        return entry[0]
+
+    CACHE_REQUESTS.inc("cart_files", "miss")
+    raw_code = get_cart_code(cart_id)
+    if raw_code is None:
+        return None
+    file_map = parse_cart_files(raw_code)
+    with CART_FILES_LOCK:
+        # Key: cart id, Value: (file map, expires_at)
+        CART_FILES[cart_id] = (file_map, time.monotonic() + CART_CODE_CACHE.ttl)
+        while len(CART_FILES) > CART_FILES_CACHE_SIZE:
+            CART_FILES.popitem(last=False)
+    return file_map
+
+# --- Generated Code Post-processing ---
+# Model output is validated and normalised before it is stored: file entries
+# are checked, exact duplicates dropped and HTML/CSS/JS minified, then the
+# structure is serialised once, compactly. The minifiers only remove comments
+# and whitespace that cannot change behaviour: HTML text nodes are left alone
+# (white-space: pre and hidden data elements depend on them), and anything
+# they cannot tokenise is handed back untouched. When minification changes
+# the code, the model's original output is kept in cart_sources (see
+# /api/carts/<id>/original).
+GENERATION_MINIFY = os.environ.get("GENERATION_MINIFY", "1").strip() != "0"
+GENERATION_KEEP_ORIGINAL = os.environ.get("GENERATION_KEEP_ORIGINAL", "1").strip() != "0"
+
+CSS_TOKEN = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|/\*!.*?\*/|(?:\s|/\*(?!!).*?\*/)+', re.S)
+CSS_TIGHT = set('{};,>')
+# JS punctuation a space or newline next to can always be dropped
+JS_TIGHT = set('{}()[];,:=>!?&|')
+JS_NEWLINE_AFTER = set('{;,([')
+JS_NEWLINE_BEFORE = set('})];,')
+JS_REGEX_AFTER = set('(,=:[!&|?{};+-*%<>~^')
+JS_REGEX_KEYWORDS = ("return", "typeof", "case", "do", "else", "in", "of", "new", "delete", "void", "throw", "instanceof", "yield", "await")
+# After the `)` closing one of these heads a statement starts, so `/` opens a regex
+JS_CONDITION_KEYWORDS = ("if", "while", "for", "with")
+HTML_TAG_BODY = r'[^>"\']*(?:(?:"[^"]*"|\'[^\']*\')[^>"\']*)*'
+# Only whitespace that runs from the end of one tag to the start of the next
+# (the gap) is collapsed; whitespace inside text content is kept as written
+HTML_TOKEN = re.compile(
+    r'(?:(?P<comment><!--(?!\[).*?-->)'
+    r'|<(?P<raw>script|style|pre|textarea)\b(?P<attrs>' + HTML_TAG_BODY + r')>(?P<body>.*?)</(?P=raw)\s*>'
+    r'|(?P<tag></?[A-Za-z!?]' + HTML_TAG_BODY + r'>))'
+    r'(?P<gap>\s+(?=<|\Z))?',
+    re.I | re.S
+)
+HTML_SCRIPT_TYPE = re.compile(r'\btype\s*=\s*["\']?([^"\'\s>]+)', re.I)
+JS_MIME_TYPES = ("", "module", "text/javascript", "application/javascript")
+JSON_MIME_TYPES = ("application/json", "application/ld+json", "importmap")
+
+def minify_css(source):
+    def replace(match):
+        token = match.group(0)
+        if token[0] in '"\'' or token.startswith('/*!'):
+            return token
+        start, end = match.start(), match.end()
+        before = source[start - 1] if start else ''
+        after = source[end] if end < len(source) else ''
+        # A space before ':' can be a descendant combinator (a :hover); after it, it never matters
+        if not before or not after or before in CSS_TIGHT or after in CSS_TIGHT or before == ':':
+            return ''
+        return ' '
+    return CSS_TOKEN.sub(replace, source)
+
+def minify_js(source):
+    """Drops comments and redundant whitespace, keeping every newline ASI could depend on."""
+    out = []
+    i, n = 0, len(source)
+    templates = []  # open `${` depth per enclosing template literal
+    parens = []  # per open `(`: whether it follows if/while/for/with
+    closed_condition = False  # whether the last `)` closed such a head
+    pending = None  # whitespace seen since the last token: None, ' ' or '\n'
+
+    def last_char():
+        return out[-1][-1] if out else ''
+
+    def emit(token):
+        nonlocal pending
+        prev = last_char()
+        if pending == '\n' and prev and prev not in JS_NEWLINE_AFTER and token[0] not in JS_NEWLINE_BEFORE:
+            out.append('\n')
+        elif pending == ' ' and prev and prev not in JS_TIGHT and token[0] not in JS_TIGHT:
+            out.append(' ')
+        pending = None
+        out.append(token)
+
+    def scan_template(start):
+        """Index just past the template text starting at `start`, and whether it ended in `${`."""
+        j = start
+        while j < n:
+            c = source[j]
+            if c == '\\':
+                j += 2
+            elif c == '`':
+                return j + 1, False
+            elif c == '$' and source.startswith('${', j):
+                return j + 2, True
+            else:
+                j += 1
+        return None, False
+
+    while i < n:
+        c = source[i]
+        if c in ' \t\r\n\f\v\u00a0\ufeff':
+            if c == '\n' or pending == '\n':
+                pending = '\n'
+            else:
+                pending = ' '
+            i += 1
+        elif c == '/' and source.startswith('//', i):
+            end = source.find('\n', i)
+            i = n if end == -1 else end
+        elif c == '/' and source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            if end == -1:
+                return source
+            if source.startswith('/*!', i):
+                # License comments stay
+                emit(source[i:end + 2])
+            elif '\n' in source[i:end]:
+                pending = '\n'
+            elif pending is None:
+                pending = ' '
+            i = end + 2
+        elif c in '"\'':
+            j = i + 1
+            while j < n and source[j] != c:
+                if source[j] == '\n':
+                    return source
+                j += 2 if source[j] == '\\' else 1
+            if j >= n:
+                return source
+            emit(source[i:j + 1])
+            i = j + 1
+        elif c == '`' or (c == '}' and templates and templates[-1] == 0):
+            if c == '}':
+                templates.pop()
+            end, opened = scan_template(i + 1)
+            if end is None:
+                return source
+            if opened:
+                templates.append(0)
+            emit(source[i:end])
+            i = end
+        elif c == '/':
+            prev_token = out[-1] if out else ''
+            if (not prev_token or prev_token[-1] in JS_REGEX_AFTER or prev_token in JS_REGEX_KEYWORDS
+                    or (prev_token == ')' and closed_condition)):
+                j, in_class = i + 1, False
+                while j < n and (in_class or source[j] != '/'):
+                    if source[j] == '\n':
+                        return source
+                    if source[j] == '\\':
+                        j += 1
+                    elif source[j] == '[':
+                        in_class = True
+                    elif source[j] == ']':
+                        in_class = False
+                    j += 1
+                if j >= n:
+                    return source
+                j += 1
+                while j < n and (source[j].isalnum() or source[j] in '_$'):
+                    j += 1
+                emit(source[i:j])
+                i = j
+            else:
+                emit(c)
+                i += 1
+        elif c.isalnum() or c in '_$\\' or ord(c) > 127:
+            j = i + 1
+            while j < n and (source[j].isalnum() or source[j] in '_$\\.' or ord(source[j]) > 127):
+                j += 1
+            emit(source[i:j])
+            i = j
+        else:
+            if templates:
+                if c == '{':
+                    templates[-1] += 1
+                elif c == '}':
+                    templates[-1] -= 1
+            if c == '(':
+                parens.append(bool(out) and out[-1] in JS_CONDITION_KEYWORDS)
+            elif c == ')':
+                if not parens:
+                    return source
+                closed_condition = parens.pop()
+            emit(c)
+            i += 1
+    if templates:
+        return source
+    return ''.join(out)
+
+def minify_html(source):
+    def replace(match):
+        gap = match.group('gap') or ''
+        token = match.group(0)[:len(match.group(0)) - len(gap)]
+        if gap:
+            gap = '\n' if '\n' in gap else ' '
+        if match.group('comment'):
+            # Whitespace on both sides of a dropped comment would otherwise leave a blank run
+            if not match.start() or source[match.start() - 1].isspace():
+                return ''
+            return gap
+        raw = match.group('raw')
+        if raw is None or raw.lower() in ('pre', 'textarea'):
+            return token + gap
+        raw, attrs, body = raw.lower(), match.group('attrs'), match.group('body')
+        if raw == 'style':
+            body = minify_css(body)
+        else:
+            script_type = HTML_SCRIPT_TYPE.search(attrs)
+            script_type = script_type.group(1).lower() if script_type else ""
+            if script_type in JS_MIME_TYPES:
+                body = minify_js(body)
+            elif script_type in JSON_MIME_TYPES:
+                # Re-serialising can unescape <\/script>, which would end the element early
+                body = minify_json(body).replace('</', '<\\/')
+        return f"<{match.group('raw')}{attrs}>{body}</{match.group('raw')}>{gap}"
+    return HTML_TOKEN.sub(replace, source)
+
+def minify_json(source):
+    try:
+        return json.dumps(json.loads(source), separators=(',', ':'), ensure_ascii=False)
+    except ValueError:
+        return source
+
+MINIFIERS = {
+    '.html': minify_html, '.htm': minify_html,
+    '.css': minify_css,
+    '.js': minify_js, '.mjs': minify_js,
+    '.json': minify_json,
+}
+
+def normalize_files(files):
+    """Validates generated file entries; returns [{"name", "content"}] without exact duplicates."""
+    if not isinstance(files, list):
+        raise Exception("Invalid JSON structure: 'files' must be a list")
+    by_name = {}
+    for file_obj in files:
+        if not isinstance(file_obj, dict):
+            continue
+        name = str(file_obj.get('name') or '').strip().lstrip('/')
+        while name.startswith('./'):
+            name = name[2:]
+        if not name:
+            continue
+        content = file_obj.get('content')
+        if content is None:
+            content = ''
+        elif isinstance(content, (dict, list)):
+            content = json.dumps(content, ensure_ascii=False)
+        elif not isinstance(content, str):
+            content = str(content)
+        try:
+            content.encode('utf-8')
+        except UnicodeEncodeError:
+            content = content.encode('utf-8', 'replace').decode('utf-8')
+        if name in by_name and by_name[name] != content:
+            # Same name, different content: /run serves the last one, so keep that
+            print(f"Generated files: duplicate name {name}, keeping the last one")
+        by_name[name] = content
+    if not by_name:
+        raise Exception("Invalid JSON structure: no usable files")
+    return [{"name": name, "content": content} for name, content in by_name.items()]
+
+def postprocess_generated(json_structure, minify):
+    """Normalises (and optionally minifies) parsed model output; returns the stored code string."""
+    files = normalize_files(json_structure.get('files'))
+    if minify:
+        for file_obj in files:
+            minifier = MINIFIERS.get(os.path.splitext(file_obj['name'])[1].lower())
+            if minifier is not None:
+                try:
+                    file_obj['content'] = minifier(file_obj['content'])
+                except Exception as e:
+                    print(f"Minify error ({file_obj['name']}): {e}")
+    return json.dumps({**json_structure, "files": files}, separators=(',', ':'), ensure_ascii=False)
+
+def save_cart_source(cart_id, original_code):
+    """Keeps the model's unminified output next to the cart. Best effort: the cart is already saved."""
+    try:
+        url = f"{SUPABASE_URL}/rest/v1/cart_sources"
+        resp = upstream.post(url, json={"cart_id": cart_id, "code": original_code}, headers=get_db_headers())
+        if resp.status_code >= 300:
+            print(f"Cart source save failed: {resp.text}")
+    except Exception as e:
+        print(f"Cart source save error: {e}")
+
+def get_cart_source(cart_id):
+    """The model's original output for a cart, or its stored code if no original was kept."""
+    url = f"{SUPABASE_URL}/rest/v1/cart_sources?select=code&cart_id=eq.{cart_id}"
+    resp = upstream.get(url, headers=get_db_headers())
+    if resp.status_code < 300 and resp.json():
+        return resp.json()[0]['code']
+    return get_cart_code(cart_id)
+
 # --- OpenRouter Generation ---
 def generate_with_openrouter(prompt, model):
     if not OPENROUTER_KEY:
         raise Exception("OpenRouter Key not configured on server")
 
-    url = "https://openrouter.ai/api/v1/chat/completions"
+    url = OPENROUTER_URL
     print(f"Calling OpenRouter URL: {url}")
     
     headers = {
@@ -223,7 +1754,7 @@ def generate_with_openrouter(prompt, model):
     }
 
     try:
-        response = requests.post(url, json=payload, headers=headers, timeout=120) 
+        response = upstream.post(url, json=payload, headers=headers, timeout=120) 
         
         if response.status_code == 200:
             data = response.json()
@@ -246,22 +1777,59 @@ def generate_with_openrouter(prompt, model):
 
 # --- SocketIO Events ---
 
+def track_room_membership(room, sid, joined):
+    with SOCKET_ROOM_LOCK:
+        members = SOCKET_ROOM_MEMBERS.get(room)
+        if joined:
+            if members is None:
+                members = SOCKET_ROOM_MEMBERS[room] = set()
+            members.add(sid)
+            SOCKET_SID_ROOMS.setdefault(sid, set()).add(room)
+        else:
+            if members is not None:
+                members.discard(sid)
+                if not members:
+                    del SOCKET_ROOM_MEMBERS[room]
+            rooms = SOCKET_SID_ROOMS.get(sid)
+            if rooms is not None:
+                rooms.discard(room)
+                if not rooms:
+                    del SOCKET_SID_ROOMS[sid]
+        SOCKET_ROOMS.set(value=len(SOCKET_ROOM_MEMBERS))
+
+@socketio.on('connect')
+def on_connect(auth=None):
+    SOCKET_CONNECTIONS.inc()
+
+@socketio.on('disconnect')
+def on_disconnect(*args):
+    SOCKET_CONNECTIONS.dec()
+    with SOCKET_ROOM_LOCK:
+        rooms = list(SOCKET_SID_ROOMS.get(request.sid, ()))
+    for room in rooms:
+        track_room_membership(room, request.sid, joined=False)
+
 @socketio.on('join')
 def on_join(data):
+    SOCKET_MESSAGES.inc('join')
     room = data.get('room')
     if not room: return
     join_room(room)
+    track_room_membership(room, request.sid, joined=True)
     emit('player_joined', {'sid': request.sid}, room=room, include_self=False)
 
 @socketio.on('leave')
 def on_leave(data):
+    SOCKET_MESSAGES.inc('leave')
     room = data.get('room')
     if not room: return
     leave_room(room)
+    track_room_membership(room, request.sid, joined=False)
     emit('player_left', {'sid': request.sid}, room=room)
 
 @socketio.on('state_update')
 def on_state_update(data):
+    SOCKET_MESSAGES.inc('state_update')
     room = data.get('room')
     payload = data.get('data')
     if room and payload is not None:
@@ -269,10 +1837,135 @@ def on_state_update(data):
 
 @socketio.on('chat_message')
 def on_chat_message(data):
+    SOCKET_MESSAGES.inc('chat_message')
     room = data.get('room')
     if room:
         emit('chat_message', data, room=room, include_self=False)
 
+# --- Request Metrics ---
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    if METRICS_EXPORTER is not None:
+        METRICS_EXPORTER.ensure_started()
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.get('request_start')
+    if start is not None:
+        total = time.perf_counter() - start
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        HTTP_REQUEST_SECONDS.observe(total, request.method, route, response.status_code)
+        spans = g.get('spans') or {}
+        if SERVER_TIMING_ENABLED:
+            response.headers['Server-Timing'] = format_server_timing(spans, total)
+        if TIMING_LOG_ENABLED:
+            print(json.dumps({
+                "event": "request_timing",
+                "method": request.method,
+                "route": route,
+                "status": response.status_code,
+                "total_ms": round(total * 1000, 1),
+                "spans_ms": {name: round(seconds * 1000, 1) for name, seconds in spans.items()}
+            }))
+    return response
+
+# --- Response Compression ---
+# JSON API responses above COMPRESS_MIN_SIZE are compressed with the best
+# encoding the client accepts. Levels favour latency over ratio. Compressed
+# bodies of successful GETs are kept in a byte-bounded LRU keyed by a digest
+# of the uncompressed body, so hot carts and feeds are compressed once.
+COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", "1024"))
+COMPRESS_CACHE_MAX_BYTES = int(os.environ.get("COMPRESS_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+COMPRESS_GZIP_LEVEL = 5
+COMPRESS_BROTLI_QUALITY = 4
+COMPRESS_ZSTD_LEVEL = 3
+
+def compress_body(body, encoding):
+    if encoding == "zstd":
+        return lazy_import("zstandard").ZstdCompressor(level=COMPRESS_ZSTD_LEVEL).compress(body)
+    if encoding == "br":
+        return lazy_import("brotli").compress(body, quality=COMPRESS_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=COMPRESS_GZIP_LEVEL, mtime=0)
+
+def available_encodings():
+    """Encodings this server can produce, in preference order."""
+    encodings = []
+    if module_available("zstandard"):
+        encodings.append("zstd")
+    if module_available("brotli"):
+        encodings.append("br")
+    encodings.append("gzip")
+    return tuple(encodings)
+
+RESPONSE_ENCODINGS = available_encodings()
+
+class CompressedCache:
+    """LRU of compressed bodies bounded by total size in bytes."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def set(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = body
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+COMPRESSED_RESPONSES = CompressedCache(COMPRESS_CACHE_MAX_BYTES)
+
+@app.after_request
+def compress_response(response):
+    if (response.direct_passthrough
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype != 'application/json'
+            or not request.path.startswith('/api/')):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = next((e for e in RESPONSE_ENCODINGS if request.accept_encodings[e] > 0), None)
+    body = response.get_data()
+    if encoding is None or len(body) < COMPRESS_MIN_SIZE:
+        return response
+
+    with span("compress"):
+        cacheable = request.method == 'GET' and response.status_code == 200
+        key = (hashlib.blake2b(body, digest_size=16).digest(), encoding) if cacheable else None
+        compressed = COMPRESSED_RESPONSES.get(key) if cacheable else None
+        if compressed is not None:
+            CACHE_REQUESTS.inc("compressed_response", "hit")
+        else:
+            compressed = compress_body(body, encoding)
+            if cacheable:
+                CACHE_REQUESTS.inc("compressed_response", "miss")
+                COMPRESSED_RESPONSES.set(key, compressed)
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    # Encoded bytes differ from the identity body, so a strong ETag would be wrong
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
 # --- Global Error Handlers ---
 
 @app.errorhandler(Exception)
@@ -294,6 +1987,12 @@ def not_found(e):
 def health_check():
     return jsonify({"status": "ok"}), 200
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    if METRICS_TOKEN and request.headers.get('Authorization') != f"Bearer {METRICS_TOKEN}":
+        return jsonify({"error": "Unauthorized"}), 401
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
 # --- Auth Routes ---
 
 @app.route('/api/auth/signup', methods=['POST'])
@@ -311,7 +2010,7 @@ def auth_signup():
     }
     
     try:
-        resp = requests.post(url, json=payload, headers=headers)
+        resp = upstream.post(url, json=payload, headers=headers)
         if resp.status_code >= 400:
             try:
                 err = resp.json()
@@ -329,7 +2028,7 @@ def auth_signin():
     if not SUPABASE_URL: return jsonify({"error": "DB Config Missing"}), 500
     url = f"{SUPABASE_URL}/auth/v1/token?grant_type=password"
     payload = {"email": data.get('email'), "password": data.get('password')}
-    resp = requests.post(url, json=payload, headers=get_auth_headers())
+    resp = upstream.post(url, json=payload, headers=get_auth_headers())
     try:
         return jsonify(resp.json()), resp.status_code
     except:
@@ -355,7 +2054,7 @@ def update_profile():
     if new_username:
         # Check if username is taken
         check_url = f"{SUPABASE_URL}/rest/v1/profiles?username=eq.{new_username}&id=neq.{user['id']}"
-        check_resp = requests.get(check_url, headers=get_db_headers())
+        check_resp = upstream.get(check_url, headers=get_db_headers())
         if check_resp.status_code == 200 and check_resp.json():
             return jsonify({"error": "Username already taken"}), 400
         payload['username'] = new_username
@@ -367,7 +2066,7 @@ def update_profile():
         return jsonify({"error": "No data provided"}), 400
         
     url = f"{SUPABASE_URL}/rest/v1/profiles?id=eq.{user['id']}"
-    resp = requests.patch(url, json=payload, headers=get_db_headers())
+    resp = upstream.patch(url, json=payload, headers=get_db_headers())
     
     if resp.status_code >= 400:
         return jsonify({"error": resp.text}), resp.status_code
@@ -378,7 +2077,7 @@ def update_profile():
 def get_profile(username):
     # Fetch Profile
     url = f"{SUPABASE_URL}/rest/v1/profiles?username=eq.{username}&select=id,username,avatar_url,created_at"
-    resp = requests.get(url, headers=get_db_headers())
+    resp = upstream.get(url, headers=get_db_headers())
     
     if resp.status_code != 200 or not resp.json():
         return jsonify({"error": "Profile not found"}), 404
@@ -387,8 +2086,8 @@ def get_profile(username):
     user_id = profile['id']
     
     # Fetch User's Carts
-    carts_url = f"{SUPABASE_URL}/rest/v1/carts?user_id=eq.{user_id}&is_listed=eq.true&order=created_at.desc&select=*"
-    carts_resp = requests.get(carts_url, headers=get_db_headers())
+    carts_url = f"{SUPABASE_URL}/rest/v1/carts?user_id=eq.{user_id}&is_listed=eq.true&order=created_at.desc&select={CART_COLUMNS}"
+    carts_resp = upstream.get(carts_url, headers=get_db_headers())
     
     projects = []
     if carts_resp.status_code == 200:
@@ -434,12 +2133,32 @@ def request_credits():
         "status": "pending"
     }
     
-    resp = requests.post(url, json=payload, headers=get_db_headers())
+    resp = upstream.post(url, json=payload, headers=get_db_headers())
     if resp.status_code >= 400:
         return jsonify({"error": "Failed to submit request", "details": resp.text}), 500
         
     return jsonify({"success": True}), 201
 
+CREDIT_REQUESTS_DEFAULT_LIMIT = 100
+CREDIT_REQUESTS_MAX_LIMIT = 500
+CREDIT_BULK_MAX_IDS = 500
+CREDIT_ACTIONS = {"approve": "approved", "deny": "denied"}
+
+def is_uuid(value):
+    try:
+        uuid.UUID(str(value))
+        return True
+    except ValueError:
+        return False
+
+def process_credit_requests(request_ids, new_status):
+    """Applies new_status to the pending requests in one DB transaction; returns per-id outcomes."""
+    url = f"{SUPABASE_URL}/rest/v1/rpc/process_credit_requests"
+    resp = upstream.post(url, json={"request_ids": request_ids, "new_status": new_status}, headers=get_db_headers())
+    if resp.status_code != 200:
+        raise Exception(f"DB Error: {resp.text}")
+    return resp.json()
+
 @app.route('/api/admin/credits', methods=['GET'])
 def get_credit_requests():
     user = verify_token(request)
@@ -447,10 +2166,30 @@ def get_credit_requests():
     
     if not SUPABASE_URL: return jsonify({"error": "DB Config Missing"}), 500
     
-    # Get pending requests
-    url = f"{SUPABASE_URL}/rest/v1/credit_requests?status=eq.pending&order=created_at.desc"
-    resp = requests.get(url, headers=get_db_headers())
-    return jsonify(resp.json()), resp.status_code
+    # Pages only when asked for; without limit or cursor the whole queue is returned, as before
+    cursor = request.args.get('cursor')
+    paginated = cursor is not None or 'limit' in request.args
+    limit = min(max(request.args.get('limit', CREDIT_REQUESTS_DEFAULT_LIMIT, type=int), 1), CREDIT_REQUESTS_MAX_LIMIT)
+
+    # Get pending requests, newest first, keyed by (created_at, id)
+    url = f"{SUPABASE_URL}/rest/v1/credit_requests?status=eq.pending&order=created_at.desc,id.desc"
+    if paginated:
+        url += f"&limit={limit}"
+    if cursor:
+        try:
+            after_created, after_id = decode_cursor(cursor)
+            after_created, after_id = quote(str(after_created)), quote(str(after_id))
+        except ValueError:
+            return jsonify({"error": "Invalid cursor"}), 400
+        url += f"&or=(created_at.lt.{after_created},and(created_at.eq.{after_created},id.lt.{after_id}))"
+
+    resp = upstream.get(url, headers=get_db_headers())
+    rows = resp.json()
+    response = jsonify(rows)
+    response.status_code = resp.status_code
+    if paginated and resp.status_code == 200 and len(rows) == limit:
+        response.headers['X-Next-Cursor'] = encode_cursor([rows[-1]['created_at'], rows[-1]['id']])
+    return response
 
 @app.route('/api/admin/credits/approve', methods=['POST'])
 def approve_credit_request():
@@ -461,41 +2200,20 @@ def approve_credit_request():
     req_id = data.get('request_id')
     
     if not SUPABASE_URL: return jsonify({"error": "DB Config Missing"}), 500
+    if not req_id: return jsonify({"error": "request_id required"}), 400
+    if not is_uuid(req_id): return jsonify({"error": "Invalid request_id"}), 400
     
-    # 1. Fetch the request details
-    req_url = f"{SUPABASE_URL}/rest/v1/credit_requests?id=eq.{req_id}"
-    req_resp = requests.get(req_url, headers=get_db_headers())
-    requests_data = req_resp.json()
+    results = process_credit_requests([req_id], "approved")
+    outcome = results[0]['outcome'] if results else 'not_found'
     
-    if not requests_data:
+    if outcome == 'not_found':
         return jsonify({"error": "Request not found"}), 404
-        
-    credit_req = requests_data[0]
-    if credit_req['status'] != 'pending':
+    if outcome == 'already_processed':
         return jsonify({"error": "Request already processed"}), 400
-        
-    target_user_id = credit_req['user_id']
-    credits_to_add = credit_req['credits_requested']
-    
-    # 2. Get current user credits
-    prof_url = f"{SUPABASE_URL}/rest/v1/profiles?id=eq.{target_user_id}&select=credits"
-    prof_resp = requests.get(prof_url, headers=get_db_headers())
-    prof_data = prof_resp.json()
-    
-    if not prof_data:
+    if outcome == 'profile_not_found':
         return jsonify({"error": "User profile not found"}), 404
-        
-    current_credits = prof_data[0].get('credits', 0)
-    new_total = current_credits + credits_to_add
     
-    # 3. Update User Credits
-    update_credits(target_user_id, new_total)
-    
-    # 4. Mark Request Approved
-    patch_url = f"{SUPABASE_URL}/rest/v1/credit_requests?id=eq.{req_id}"
-    requests.patch(patch_url, json={"status": "approved"}, headers=get_db_headers())
-    
-    return jsonify({"success": True, "new_total": new_total}), 200
+    return jsonify({"success": True, "new_total": results[0]['new_total']}), 200
 
 @app.route('/api/admin/credits/deny', methods=['POST'])
 def deny_credit_request():
@@ -506,12 +2224,62 @@ def deny_credit_request():
     req_id = data.get('request_id')
     
     if not SUPABASE_URL: return jsonify({"error": "DB Config Missing"}), 500
+    if not req_id: return jsonify({"error": "request_id required"}), 400
+    if not is_uuid(req_id): return jsonify({"error": "Invalid request_id"}), 400
     
-    patch_url = f"{SUPABASE_URL}/rest/v1/credit_requests?id=eq.{req_id}"
-    requests.patch(patch_url, json={"status": "denied"}, headers=get_db_headers())
+    results = process_credit_requests([req_id], "denied")
+    outcome = results[0]['outcome'] if results else 'not_found'
+    
+    if outcome == 'not_found':
+        return jsonify({"error": "Request not found"}), 404
+    if outcome == 'already_processed':
+        return jsonify({"error": "Request already processed"}), 400
     
     return jsonify({"success": True}), 200
 
+@app.route('/api/admin/credits/bulk', methods=['POST'])
+def bulk_process_credit_requests():
+    user = verify_token(request)
+    if not user or not user.get('is_admin'): return jsonify({"error": "Unauthorized"}), 403
+    
+    data = request.json or {}
+    request_ids = data.get('request_ids')
+    new_status = CREDIT_ACTIONS.get(data.get('action'))
+    
+    if not SUPABASE_URL: return jsonify({"error": "DB Config Missing"}), 500
+    if new_status is None:
+        return jsonify({"error": "action must be 'approve' or 'deny'"}), 400
+    if not isinstance(request_ids, list) or not request_ids or not all(isinstance(i, str) and is_uuid(i) for i in request_ids):
+        return jsonify({"error": "request_ids must be a non-empty list of request UUIDs"}), 400
+    if len(request_ids) > CREDIT_BULK_MAX_IDS:
+        return jsonify({"error": f"At most {CREDIT_BULK_MAX_IDS} requests per batch"}), 400
+    
+    results = process_credit_requests(request_ids, new_status)
+    
+    summary = {}
+    for result in results:
+        summary[result['outcome']] = summary.get(result['outcome'], 0) + 1
+    return jsonify({"success": True, "results": results, "summary": summary}), 200
+
+@app.route('/api/admin/profile', methods=['GET'])
+def admin_profile():
+    user = verify_token(request)
+    if not user or not user.get('is_admin'): return jsonify({"error": "Unauthorized"}), 403
+
+    try:
+        seconds = float(request.args.get('seconds', 10))
+        interval_ms = float(request.args.get('interval_ms', 10))
+    except ValueError:
+        return jsonify({"error": "seconds and interval_ms must be numbers"}), 400
+
+    seconds = min(max(seconds, 0.1), PROFILE_MAX_SECONDS)
+    interval_ms = min(max(interval_ms, 1), 1000)
+
+    report = profiler.run(seconds, interval_ms / 1000)
+    if report is None:
+        return jsonify({"error": "A profile is already running"}), 409
+    return Response(report, mimetype='text/plain')
+
 @app.route('/api/admin/ban', methods=['POST'])
 def admin_ban_user():
     user = verify_token(request)
@@ -529,7 +2297,7 @@ def admin_ban_user():
 
     url = f"{SUPABASE_URL}/rest/v1/profiles?id=eq.{target_user_id}"
     payload = {"is_banned": True}
-    resp = requests.patch(url, json=payload, headers=get_db_headers())
+    resp = upstream.patch(url, json=payload, headers=get_db_headers())
     
     if resp.status_code >= 400:
         return jsonify({"error": "Failed to ban user", "details": resp.text}), resp.status_code
@@ -547,7 +2315,7 @@ def random_project():
     headers['Prefer'] = 'count=exact'
     
     try:
-        head_resp = requests.head(count_url, headers=headers)
+        head_resp = upstream.head(count_url, headers=headers)
         content_range = head_resp.headers.get('Content-Range')
         
         total = 0
@@ -562,7 +2330,7 @@ def random_project():
 
         random_offset = random.randint(0, total - 1)
         fetch_url = f"{SUPABASE_URL}/rest/v1/carts?select=id&is_listed=eq.true&limit=1&offset={random_offset}"
-        resp = requests.get(fetch_url, headers=get_db_headers())
+        resp = upstream.get(fetch_url, headers=get_db_headers())
         
         data = resp.json()
         if not data:
@@ -583,23 +2351,25 @@ def random_project():
 def download_project_zip(id):
     if not SUPABASE_URL: return jsonify({"error": "DB Config Missing"}), 500
 
-    url = f"{SUPABASE_URL}/rest/v1/carts?select=name,code&id=eq.{id}"
     try:
-        resp = requests.get(url, headers=get_db_headers())
-        data = resp.json()
+        meta = get_cart_meta(id)
+        if meta is None:
+            raw_code = None
+        elif request.args.get('original') == '1':
+            raw_code = get_cart_source(id)
+        else:
+            raw_code = get_cart_code(id)
         
-        if not data:
+        if meta is None or raw_code is None:
             return jsonify({"error": "Cart not found"}), 404
         
-        cart = data[0]
-        raw_code = cart.get('code', '')
-        name = cart.get('name', 'project')
+        name = meta['cart'].get('name') or 'project'
         safe_name = "".join([c for c in name if c.isalnum() or c in (' ', '-', '_')]).strip().replace(' ', '_')
         if not safe_name:
             safe_name = f"project-{id}"
 
         memory_file = io.BytesIO()
-        with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
+        with span("zip"), zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
             try:
                 json_structure = json.loads(raw_code)
                 if 'files' in json_structure and isinstance(json_structure['files'], list):
@@ -624,6 +2394,38 @@ def download_project_zip(id):
         print(f"Zip Download Error: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/search', methods=['GET'])
+def search_carts():
+    if not SUPABASE_URL: return jsonify({"error": "DB Config Missing"}), 500
+
+    search_query = build_search_query(request.args.get('q', ''))
+    if not search_query:
+        return jsonify({"error": f"Search query needs a word of at least {SEARCH_MIN_TERM_LENGTH} characters"}), 400
+
+    limit = min(max(request.args.get('limit', SEARCH_DEFAULT_LIMIT, type=int), 1), SEARCH_MAX_LIMIT)
+    after_rank, after_id = None, None
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            after_rank, after_id = decode_cursor(cursor)
+            # after_id goes to the RPC as a uuid; anything else would surface as a DB error
+            if not isinstance(after_rank, (int, float)) or not isinstance(after_id, str) or not is_uuid(after_id):
+                raise ValueError("Invalid cursor")
+        except ValueError:
+            return jsonify({"error": "Invalid cursor"}), 400
+
+    cache_key = f"{search_query}|{limit}|{cursor or ''}"
+    try:
+        results = SEARCH_CACHE.get_or_load(cache_key, lambda: fetch_search_page(search_query, limit, after_rank, after_id))
+    except Exception as e:
+        return jsonify({"error": "Search failed", "details": str(e)}), 500
+
+    next_cursor = None
+    if len(results) == limit:
+        last = results[-1]
+        next_cursor = encode_cursor([last['rank'], last['id']])
+    return jsonify({"results": results, "next_cursor": next_cursor}), 200
+
 @app.route('/api/carts', methods=['GET'])
 def get_carts():
     if not SUPABASE_URL: return jsonify({"error": "DB Config Missing"}), 500
@@ -631,37 +2433,63 @@ def get_carts():
     sort_mode = request.args.get('sort', 'recent')
     filter_user_id = request.args.get('user_id')
     
+    if sort_mode == 'trending' and not filter_user_id:
+        TRENDING.ensure_started()
+        top_ids = list(TRENDING.top_ids)
+        # An empty top-K means the first snapshot failed or is still loading; never cache that
+        if not top_ids:
+            return jsonify([]), 200
+        try:
+            carts = FEED_CACHE.get_or_load(feed_cache_key('trending'), lambda: fetch_carts_by_ids(top_ids))
+        except Exception as e:
+            return jsonify({"error": "DB Error", "details": str(e)}), 500
+        with span("json"):
+            return jsonify(carts), 200
+
     # Use join to get profile info
-    url = f"{SUPABASE_URL}/rest/v1/carts?select=*,profiles(username,avatar_url)"
+    url = f"{SUPABASE_URL}/rest/v1/carts?select={CART_FEED_COLUMNS}"
 
     if filter_user_id:
         url += f"&user_id=eq.{filter_user_id}"
     else:
         url += "&is_listed=eq.true"
     
-    if sort_mode == 'popular':
+    if sort_mode in ('popular', 'trending'):
         url += '&order=views.desc'
     else:
         url += '&order=created_at.desc'
         
     url += '&limit=50'
 
-    resp = requests.get(url, headers=get_db_headers())
     try:
-        return jsonify(resp.json()), resp.status_code
-    except:
-        return jsonify({"error": "DB Error", "details": resp.text}), 500
+        carts = FEED_CACHE.get_or_load(feed_cache_key(sort_mode, filter_user_id), lambda: fetch_feed(url))
+    except Exception as e:
+        return jsonify({"error": "DB Error", "details": str(e)}), 500
+    with span("json"):
+        return jsonify(carts), 200
 
 @app.route('/api/carts/<id>', methods=['GET'])
 def get_cart_by_id(id):
     if not SUPABASE_URL: return jsonify({"error": "DB Config Missing"}), 500
 
-    url = f"{SUPABASE_URL}/rest/v1/carts?select=*,profiles(username,avatar_url)&id=eq.{id}"
-    resp = requests.get(url, headers=get_db_headers())
-    data = resp.json()
-    if not data:
+    meta = get_cart_meta(id)
+    raw_code = get_cart_code(id) if meta else None
+    if meta is None or raw_code is None:
+        return jsonify({"error": "Cart not found"}), 404
+    with span("json"):
+        response = jsonify({**meta['cart'], "code": raw_code})
+    return conditional_response(response)
+
+@app.route('/api/carts/<id>/original', methods=['GET'])
+def get_cart_original(id):
+    if not SUPABASE_URL: return jsonify({"error": "DB Config Missing"}), 500
+
+    if get_cart_meta(id) is None:
         return jsonify({"error": "Cart not found"}), 404
-    return jsonify(data[0]), 200
+    code = get_cart_source(id)
+    if code is None:
+        return jsonify({"error": "Cart not found"}), 404
+    return jsonify({"id": id, "code": code})
 
 @app.route('/api/carts/<id>', methods=['DELETE'])
 def delete_cart(id):
@@ -674,11 +2502,13 @@ def delete_cart(id):
     if not SUPABASE_URL: return jsonify({"error": "DB Config Missing"}), 500
     
     url = f"{SUPABASE_URL}/rest/v1/carts?id=eq.{id}"
-    resp = requests.delete(url, headers=get_db_headers())
+    resp = upstream.delete(url, headers=get_db_headers())
     
     if resp.status_code >= 400:
         return jsonify({"error": "Delete failed", "details": resp.text}), resp.status_code
         
+    invalidate_cart(id, code=True)
+    invalidate_feeds()
     return jsonify({"success": True}), 200
 
 @app.route('/api/carts/<id>', methods=['PATCH'])
@@ -701,11 +2531,13 @@ def update_cart(id):
     
     url = f"{SUPABASE_URL}/rest/v1/carts?id=eq.{id}&user_id=eq.{user['id']}"
     
-    resp = requests.patch(url, json=payload, headers=get_db_headers())
+    resp = upstream.patch(url, json=payload, headers=get_db_headers())
     
     if resp.status_code >= 400:
         return jsonify({"error": "Update failed (Check permission)", "details": resp.text}), resp.status_code
 
+    invalidate_cart(id)
+    invalidate_feeds(user['id'])
     return jsonify({"success": True}), 200
 
 
@@ -717,10 +2549,11 @@ def increment_cart_view(id):
     payload = {"row_id": id}
     
     try:
-        resp = requests.post(url, json=payload, headers=get_db_headers())
+        resp = upstream.post(url, json=payload, headers=get_db_headers())
         if resp.status_code >= 400:
             print(f"Failed to increment views for {id}: {resp.text}")
             return jsonify({"success": False}), 200
+        TRENDING.record_view(id)
         return jsonify({"success": True}), 200
     except Exception as e:
         print(f"View increment error: {e}")
@@ -728,6 +2561,13 @@ def increment_cart_view(id):
 
 @app.route('/api/generate', methods=['POST'])
 def generate_cart():
+    GENERATIONS_IN_PROGRESS.inc()
+    try:
+        return handle_generate()
+    finally:
+        GENERATIONS_IN_PROGRESS.dec()
+
+def handle_generate():
     user = verify_token(request)
     if not user:
         return jsonify({"error": "Unauthorized"}), 401
@@ -743,9 +2583,12 @@ def generate_cart():
     multiplayer_enabled = data.get('multiplayer', False)
     provider = data.get('provider', 'official') 
     is_mobile = data.get('is_mobile', False)
+    minify = data.get('minify', GENERATION_MINIFY)
     
     if not prompt:
         return jsonify({"error": "Prompt required"}), 400
+    if not isinstance(minify, bool):
+        return jsonify({"error": "minify must be true or false"}), 400
         
     cost = 0
     if provider == 'official':
@@ -836,20 +2679,23 @@ You MUST implement real-time multiplayer functionality using the provided WebSoc
             raw_output = generate_with_openrouter(openrouter_prompt, model=model_used)
             
         else:
+            ai_client = get_ai_client()
             if not ai_client:
                 raise Exception("Official API Key not configured on server")
-            
+            from google.genai import types
+
             model_used = "gemini-3-flash-preview"
             
-            response = ai_client.models.generate_content(
-                model=model_used,
-                contents=final_prompt,
-                config=types.GenerateContentConfig(
-                    system_instruction=system_instruction,
-                    temperature=0.7,
-                    response_mime_type="application/json"
+            with track_upstream("gemini", "POST"):
+                response = ai_client.models.generate_content(
+                    model=model_used,
+                    contents=final_prompt,
+                    config=types.GenerateContentConfig(
+                        system_instruction=system_instruction,
+                        temperature=0.7,
+                        response_mime_type="application/json"
+                    )
                 )
-            )
             if not response.text:
                 raise Exception("AI returned empty response")
             raw_output = response.text
@@ -862,15 +2708,22 @@ You MUST implement real-time multiplayer functionality using the provided WebSoc
         if cleaned_output.endswith("```"):
             cleaned_output = cleaned_output[:-3]
         
+        original_code = None
         try:
-            json_structure = json.loads(cleaned_output)
-            if 'files' not in json_structure:
-                 if isinstance(json_structure, list):
-                     json_structure = {"files": json_structure}
-                 else:
-                     raise Exception("Invalid JSON structure: Missing 'files' key")
-            
-            final_code_storage = json.dumps(json_structure)
+            with span("json"):
+                json_structure = json.loads(cleaned_output)
+                if 'files' not in json_structure:
+                     if isinstance(json_structure, list):
+                         json_structure = {"files": json_structure}
+                     else:
+                         raise Exception("Invalid JSON structure: Missing 'files' key")
+
+                final_code_storage = postprocess_generated(json_structure, minify)
+                # Only worth a second copy when minifying actually changed something
+                if minify and GENERATION_KEEP_ORIGINAL and final_code_storage != postprocess_generated(json_structure, False):
+                    original_code = cleaned_output
+            GENERATED_CODE_BYTES.inc("original", amount=len(cleaned_output.encode('utf-8', 'replace')))
+            GENERATED_CODE_BYTES.inc("stored", amount=len(final_code_storage.encode('utf-8')))
 
         except json.JSONDecodeError:
             print("JSON Parsing Failed, falling back to raw string storage")
@@ -886,7 +2739,7 @@ You MUST implement real-time multiplayer functionality using the provided WebSoc
         return jsonify({"error": str(e)}), 500
 
     try:
-        url = f"{SUPABASE_URL}/rest/v1/carts"
+        url = f"{SUPABASE_URL}/rest/v1/carts?select={CART_COLUMNS}"
         payload = {
             "user_id": user['id'],
             "username": user.get('user_metadata', {}).get('username', 'Anonymous'),
@@ -897,56 +2750,95 @@ You MUST implement real-time multiplayer functionality using the provided WebSoc
             "views": 0,
             "is_listed": False 
         }
-        db_resp = requests.post(url, json=payload, headers=get_db_headers())
+        db_resp = upstream.post(url, json=payload, headers=get_db_headers())
         
         if db_resp.status_code >= 300:
             raise Exception(f"DB Error: {db_resp.text}")
         
+        cart = db_resp.json()[0]
         if cost > 0:
             new_credits = current_credits - cost
             update_credits(user['id'], new_credits)
+
+        if original_code is not None:
+            save_cart_source(cart['id'], original_code)
+
+        invalidate_feeds(user['id'])
             
-        return jsonify({"success": True, "cart": db_resp.json()[0]}), 201
+        return jsonify({"success": True, "cart": cart}), 201
     
     except Exception as e:
         print(f"Save Error: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/frontend/<path:filename>')
+def serve_frontend_asset(filename):
+    asset = static_assets().get(filename)
+    if asset is None:
+        return "Not found", 404
+    immutable = filename != asset.relpath or request.args.get('v') == asset.fingerprint
+    cache_control = IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL
+    return send_static_variant(asset.variants, asset.mimetype, asset.etag, cache_control, 'Accept-Encoding')
+
 @app.route('/playsoullogo.png')
 def serve_logo():
-    logo_filename = 'playsoullogo.png'
-    logo_path = os.path.join(BASE_DIR, logo_filename)
-    if os.path.exists(logo_path):
-        return send_file(logo_path, mimetype='image/png')
-    logo_path_frontend = os.path.join(FRONTEND_DIR, logo_filename)
-    if os.path.exists(logo_path_frontend):
-        return send_file(logo_path_frontend, mimetype='image/png')
-    return "Logo not found", 404
+    if logo_bytes() is None:
+        return "Logo not found", 404
+
+    # Snap ?w= to a fixed set of widths so the variant cache stays bounded
+    width = request.args.get('w', type=int)
+    if width:
+        width = next((w for w in LOGO_WIDTHS if w >= width), None)
+
+    accepted = dict(request.accept_mimetypes)
+    fmt = next((f for f in logo_formats() if accepted.get(f"image/{f}", 0) > 0), 'png')
+
+    body, mimetype, etag = render_logo_variant(width, fmt)
+    return send_static_variant({None: body}, mimetype, etag, LOGO_CACHE_CONTROL, 'Accept')
+
+# No `defaults=` here: Werkzeug would then answer /run/<id>/index.html with a redirect to /run/<id>/
+@app.route('/run/<cart_id>/')
+@app.route('/run/<cart_id>/<path:filename>')
+def serve_cart_file(cart_id, filename='index.html'):
+    if not SUPABASE_URL: return jsonify({"error": "DB Config Missing"}), 500
+
+    file_map = get_cart_files(cart_id)
+    if file_map is None:
+        return "Cart not found", 404
+    entry = file_map.get(filename)
+    if entry is None:
+        return "File not found", 404
+
+    variants, mimetype, etag = entry
+    response = send_static_variant(variants, mimetype, etag, CART_FILE_CACHE_CONTROL, 'Accept-Encoding')
+    response.headers['Content-Security-Policy'] = CART_FILE_CSP
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
 
 @app.route('/site/<id>', methods=['GET'])
 def serve_site_preview(id):
     if not SUPABASE_URL:
         return serve_html_with_meta() 
 
-    url = f"{SUPABASE_URL}/rest/v1/carts?select=name,prompt,username&id=eq.{id}"
     title = None
     description = None
     try:
-        resp = requests.get(url, headers=get_db_headers())
-        if resp.status_code == 200:
-            data = resp.json()
-            if data and len(data) > 0:
-                cart = data[0]
-                display_name = cart.get('name') or cart.get('prompt', 'Untitled Cart')
-                title = display_name
-                if len(title) > 60:
-                    title = title[:57] + "..."
-                username = cart.get('username', 'Anonymous')
-                description = f"A PlaySOUL cart by {username}"
+        meta = get_cart_meta(id)
+        if meta:
+            cart = meta['cart']
+            display_name = cart.get('name') or cart.get('prompt', 'Untitled Cart')
+            title = display_name
+            if len(title) > 60:
+                title = title[:57] + "..."
+            username = cart.get('username', 'Anonymous')
+            description = f"A PlaySOUL cart by {username}"
     except Exception as e:
         print(f"Meta fetch error: {e}")
 
-    return serve_html_with_meta(title=title, description=description)
+    html_content = serve_html_with_meta(title=title, description=description)
+    if isinstance(html_content, tuple):
+        return html_content
+    return conditional_response(Response(html_content, mimetype='text/html'))
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -955,5 +2847,25 @@ def serve_spa(path):
         return jsonify({"error": f"API Endpoint not found: {request.path}"}), 404
     return serve_html_with_meta()
 
+# --- Preload ---
+# Only fork-safe state is built here. The Gemini client, SQLite connections,
+# the trending thread and the metrics flush thread are still created per
+# worker. Upstream calls go through requests.request, which opens a fresh
+# connection pool per call, so no HTTP state is shared across the fork.
+PRELOAD_MODULES = ("google.genai", "google.genai.types", "brotli", "zstandard", "PIL.Image", "PIL.features")
+
+def preload():
+    started = time.perf_counter()
+    for name in PRELOAD_MODULES:
+        lazy_import(name)
+    static_assets()
+    index_html()
+    logo_bytes()
+    logo_formats()
+    print(f"Preloaded app state in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+if PRELOAD_APP:
+    preload()
+
 if __name__ == '__main__':
     socketio.run(app, port=5000, debug=True)
@@ -0,0 +1,43 @@
+"""Compares two bench/run.py result files scenario by scenario.
+
+    python bench/compare.py bench/results/before.json bench/results/after.json
+"""
+import argparse
+import json
+
+COLUMNS = ("throughput_rps", "p50_ms", "p95_ms", "p99_ms", "errors")
+
+
+def delta(before, after):
+    if before in (None, 0) or after is None:
+        return ""
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    print(f"before: {before['label']} ({before.get('git_commit')})  after: {after['label']} ({after.get('git_commit')})")
+    header = f"{'scenario':<14}" + "".join(f"{c:>26}" for c in COLUMNS)
+    print(header)
+    print("-" * len(header))
+    for name in sorted(set(before["scenarios"]) | set(after["scenarios"])):
+        b = before["scenarios"].get(name, {})
+        a = after["scenarios"].get(name, {})
+        cells = []
+        for column in COLUMNS:
+            bv, av = b.get(column), a.get(column)
+            cells.append(f"{str(bv):>8} -> {str(av):<8} {delta(bv, av):>7}")
+        print(f"{name:<14}" + "".join(f"{c:>26}" for c in cells))
+
+
+if __name__ == "__main__":
+    main()
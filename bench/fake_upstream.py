@@ -0,0 +1,448 @@
+"""Local stand-ins for Supabase (PostgREST + GoTrue) and the LLM providers.
+
+Emulates just enough of /rest/v1/*, /rest/v1/rpc/* and /auth/v1/* for app.py,
+plus Gemini and OpenRouter completion endpoints, each with configurable latency.
+Data lives in memory and is seeded deterministically from --seed.
+
+    python bench/fake_upstream.py --port 8900 --db-latency-ms 5 --llm-delay-ms 2000
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl, unquote
+
+ADMIN_USERNAME = "homelessman"
+USER_NAMESPACE = uuid.UUID("6f1c1c3e-8e0b-4c3a-9a55-5b1b0f3f0a01")
+
+
+def user_id_for(username):
+    return str(uuid.uuid5(USER_NAMESPACE, username))
+
+
+def token_for(username):
+    return f"bench-token-{username}"
+
+
+def make_code(size_kb, rng):
+    """Builds a cart `code` blob shaped like generate_cart output, roughly size_kb large."""
+    filler = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz     \n") for _ in range(512))
+    body = (filler * (size_kb * 2 + 1))[: size_kb * 1024]
+    files = [
+        {"name": "index.html", "content": f"<!DOCTYPE html><html><head><link rel=\"stylesheet\" href=\"style.css\"></head><body><pre>{body}</pre><script src=\"game.js\"></script></body></html>"},
+        {"name": "style.css", "content": "body { margin: 0; background: #020617; color: #fff; }\n" * 20},
+        {"name": "game.js", "content": "function tick() { requestAnimationFrame(tick); }\ntick();\n" * 20},
+    ]
+    return json.dumps({"files": files})
+
+
+class Store:
+    """In-memory tables keyed by name; every row is a plain dict."""
+
+    def __init__(self, users, carts, code_kb, seed):
+        rng = random.Random(seed)
+        self.lock = threading.Lock()
+        now = datetime.now(timezone.utc)
+        self.tables = {"profiles": [], "carts": [], "credit_requests": [], "cart_sources": []}
+
+        usernames = [ADMIN_USERNAME] + [f"bench-user-{i}" for i in range(users)]
+        for username in usernames:
+            self.tables["profiles"].append({
+                "id": user_id_for(username),
+                "username": username,
+                "avatar_url": None,
+                "is_banned": False,
+                "credits": 10 ** 9,
+                "last_reset_date": str(now.date()),
+                "created_at": now.isoformat(),
+            })
+
+        for i in range(carts):
+            username = rng.choice(usernames)
+            created = now - timedelta(seconds=rng.randint(0, 30 * 86400))
+            self.tables["carts"].append({
+                "id": str(uuid.UUID(int=rng.getrandbits(128))),
+                "user_id": user_id_for(username),
+                "username": username,
+                "name": f"Bench cart {i}",
+                "prompt": f"Make a {rng.choice(['space', 'puzzle', 'racing', 'platformer'])} game number {i}",
+                "model": "gemini-3-flash-preview",
+                "code": make_code(code_kb, rng),
+                "views": rng.randint(0, 5000),
+                "is_listed": rng.random() < 0.8,
+                "created_at": created.isoformat(),
+            })
+
+        for i in range(users):
+            username = f"bench-user-{i}"
+            self.tables["credit_requests"].append({
+                "id": str(uuid.UUID(int=rng.getrandbits(128))),
+                "user_id": user_id_for(username),
+                "username": username,
+                "cashtag": f"$bench{i}",
+                "amount_usd": 5,
+                "credits_requested": 100,
+                "status": "pending",
+                "created_at": (now - timedelta(seconds=i)).isoformat(),
+            })
+
+    def profile(self, user_id):
+        for row in self.tables["profiles"]:
+            if row["id"] == user_id:
+                return row
+        return None
+
+
+# --- PostgREST query emulation ---
+
+def split_top_level(value):
+    """Splits a select list on commas that are not inside parentheses."""
+    parts, depth, current = [], 0, ""
+    for ch in value:
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        if ch == "," and depth == 0:
+            parts.append(current)
+            current = ""
+        else:
+            current += ch
+    if current:
+        parts.append(current)
+    return parts
+
+
+def as_text(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if value is None:
+        return "null"
+    return str(value)
+
+
+def matches_any(row, expression, conjunction=any):
+    """Evaluates a PostgREST or=(...) / and(...) group such as or=(a.lt.1,and(a.eq.1,b.lt.2))."""
+    terms = split_top_level(expression.strip()[1:-1])
+    results = []
+    for term in terms:
+        if term.startswith("and("):
+            results.append(matches_any(row, term[3:], all))
+        elif term.startswith("or("):
+            results.append(matches_any(row, term[2:], any))
+        else:
+            column, _, rest = term.partition(".")
+            results.append(matches(row, column, rest))
+    return conjunction(results)
+
+
+def matches(row, column, expression):
+    op, _, operand = expression.partition(".")
+    value = row.get(column)
+    if op == "eq":
+        return as_text(value) == operand
+    if op == "neq":
+        return as_text(value) != operand
+    if op == "in":
+        options = [o.strip('"') for o in operand.strip("()").split(",")]
+        return as_text(value) in options
+    if op == "is":
+        return as_text(value) == operand
+    if op in ("lt", "lte", "gt", "gte"):
+        if value is None:
+            return False
+        left, right = value, operand
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            right = float(operand)
+        return {"lt": left < right, "lte": left <= right, "gt": left > right, "gte": left >= right}[op]
+    if op == "ilike":
+        needle = operand.replace("*", "").replace("%", "").lower()
+        return needle in as_text(value).lower()
+    return True
+
+
+def project(store, table, row, select):
+    if not select or select == "*":
+        return dict(row)
+    out = {}
+    for part in split_top_level(select):
+        if part == "*":
+            out.update(row)
+        elif "(" in part:
+            embed, _, inner = part.partition("(")
+            columns = inner.rstrip(")").split(",")
+            target = store.profile(row.get("user_id") if table != "profiles" else row.get("id"))
+            out[embed] = {c: target.get(c) for c in columns} if target else None
+        else:
+            out[part] = row.get(part)
+    return out
+
+
+def query(store, table, params):
+    rows = store.tables.get(table)
+    if rows is None:
+        return None
+    filters = [(k, v) for k, v in params if k not in ("select", "order", "limit", "offset", "on_conflict")]
+    result = [
+        row for row in rows
+        if all(matches_any(row, v) if k == "or" else matches(row, k, v) for k, v in filters)
+    ]
+    options = dict(params)
+    for clause in reversed(options.get("order", "").split(",") if options.get("order") else []):
+        column, _, direction = clause.partition(".")
+        result.sort(key=lambda r: (r.get(column) is None, r.get(column)), reverse=direction.startswith("desc"))
+    offset = int(options.get("offset", 0))
+    limit = int(options["limit"]) if "limit" in options else None
+    total = len(result)
+    result = result[offset: offset + limit if limit is not None else None]
+    return result, total
+
+
+# --- RPC emulation ---
+
+def rpc_increment_cart_views(store, args):
+    for row in store.tables["carts"]:
+        if row["id"] == args.get("row_id"):
+            row["views"] += 1
+    return None
+
+
+def rpc_search_carts(store, args):
+    """Approximates search_carts: every prefix term must match a word; name hits outrank prompt hits."""
+    terms = [t.strip().rstrip(":*") for t in args.get("search_query", "").split("&") if t.strip()]
+    after_rank, after_id = args.get("after_rank"), args.get("after_id")
+    found = []
+    for row in store.tables["carts"]:
+        if not row.get("is_listed"):
+            continue
+        name_words = (row.get("name") or "").lower().split()
+        prompt_words = (row.get("prompt") or "").lower().split()
+        rank = 0.0
+        for term in terms:
+            in_name = any(w.startswith(term) for w in name_words)
+            in_prompt = any(w.startswith(term) for w in prompt_words)
+            if not (in_name or in_prompt):
+                break
+            rank += (0.6 if in_name else 0) + (0.4 if in_prompt else 0)
+        else:
+            rank = round(rank / max(len(terms), 1), 6)
+            if after_rank is None or rank < after_rank or (rank == after_rank and row["id"] > after_id):
+                profile = store.profile(row["user_id"]) or {}
+                result = {k: row.get(k) for k in ("id", "user_id", "username", "name", "prompt", "model", "views", "created_at")}
+                result["profiles"] = {"username": profile.get("username"), "avatar_url": profile.get("avatar_url")}
+                result["rank"] = rank
+                found.append(result)
+    found.sort(key=lambda r: (-r["rank"], r["id"]))
+    return found[: max(1, min(int(args.get("result_limit") or 20), 100))]
+
+
+def rpc_process_credit_requests(store, args):
+    new_status = args.get("new_status")
+    if new_status not in ("approved", "denied"):
+        raise ValueError("new_status must be approved or denied")
+    results = []
+    for rid in sorted(set(args.get("request_ids") or [])):
+        req = next((r for r in store.tables["credit_requests"] if r["id"] == rid), None)
+        if req is None:
+            results.append({"request_id": rid, "outcome": "not_found", "request_status": None, "target_user_id": None, "credits_added": 0, "new_total": None})
+            continue
+        if req["status"] != "pending":
+            results.append({"request_id": rid, "outcome": "already_processed", "request_status": req["status"], "target_user_id": req["user_id"], "credits_added": 0, "new_total": None})
+            continue
+        total = None
+        if new_status == "approved":
+            profile = store.profile(req["user_id"])
+            if profile is None:
+                results.append({"request_id": rid, "outcome": "profile_not_found", "request_status": req["status"], "target_user_id": req["user_id"], "credits_added": 0, "new_total": None})
+                continue
+            profile["credits"] = (profile.get("credits") or 0) + req["credits_requested"]
+            total = profile["credits"]
+        req["status"] = new_status
+        added = req["credits_requested"] if new_status == "approved" else 0
+        results.append({"request_id": rid, "outcome": new_status, "request_status": new_status, "target_user_id": req["user_id"], "credits_added": added, "new_total": total})
+    return results
+
+
+RPCS = {
+    "increment_cart_views": rpc_increment_cart_views,
+    "search_carts": rpc_search_carts,
+    "process_credit_requests": rpc_process_credit_requests,
+}
+
+
+def llm_output(size_kb):
+    body = ("// generated benchmark output\n" * (size_kb * 40 + 1))[: size_kb * 1024]
+    files = [{"name": "index.html", "content": f"<!DOCTYPE html><html><body><script>{body}</script></body></html>"}]
+    return json.dumps({"files": files})
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeUpstream/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.config.verbose:
+            super().log_message(format, *args)
+
+    # --- plumbing ---
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return None
+        return json.loads(self.rfile.read(length) or b"null")
+
+    def send_json(self, status, payload, headers=None):
+        body = b"" if payload is None else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def delay(self, ms):
+        if ms:
+            jitter = self.server.config.jitter_ms
+            time.sleep(max(0.0, ms + random.uniform(-jitter, jitter)) / 1000)
+
+    def route(self):
+        parts = urlsplit(self.path)
+        params = parse_qsl(parts.query, keep_blank_values=True)
+        path = unquote(parts.path)
+        config = self.server.config
+        try:
+            if path.startswith("/auth/v1/"):
+                self.delay(config.auth_latency_ms)
+                return self.handle_auth(path[len("/auth/v1/"):])
+            if path.startswith("/rest/v1/rpc/"):
+                self.delay(config.db_latency_ms)
+                return self.handle_rpc(path[len("/rest/v1/rpc/"):])
+            if path.startswith("/rest/v1/"):
+                self.delay(config.db_latency_ms)
+                return self.handle_rest(path[len("/rest/v1/"):], params)
+            if path.startswith("/gemini/"):
+                self.delay(config.llm_delay_ms)
+                text = llm_output(config.llm_output_kb)
+                return self.send_json(200, {
+                    "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}]
+                })
+            if path.startswith("/openrouter/"):
+                self.delay(config.llm_delay_ms)
+                return self.send_json(200, {"choices": [{"message": {"role": "assistant", "content": llm_output(config.llm_output_kb)}}]})
+            self.send_json(404, {"message": f"No fake route for {path}"})
+        except Exception as e:
+            self.send_json(500, {"message": str(e)})
+
+    do_GET = do_POST = do_PATCH = do_DELETE = do_HEAD = route
+
+    # --- endpoints ---
+
+    def handle_auth(self, path):
+        store = self.server.store
+        if path == "user":
+            token = (self.headers.get("Authorization") or "").replace("Bearer ", "")
+            if not token.startswith("bench-token-"):
+                return self.send_json(401, {"msg": "Invalid token"})
+            username = token[len("bench-token-"):]
+            return self.send_json(200, {"id": user_id_for(username), "email": f"{username}@bench.local", "user_metadata": {"username": username}})
+        if path.startswith("token") or path.startswith("signup"):
+            body = self.read_body() or {}
+            username = (body.get("email") or "bench-user-0").split("@")[0]
+            return self.send_json(200, {"access_token": token_for(username), "token_type": "bearer", "user": {"id": user_id_for(username)}})
+        return self.send_json(404, {"msg": "Unknown auth route"})
+
+    def handle_rpc(self, name):
+        fn = RPCS.get(name)
+        if fn is None:
+            return self.send_json(404, {"message": f"Unknown rpc {name}"})
+        args = self.read_body() or {}
+        with self.server.store.lock:
+            result = fn(self.server.store, args)
+        return self.send_json(200, result)
+
+    def handle_rest(self, table, params):
+        store = self.server.store
+        select = dict(params).get("select")
+        with store.lock:
+            if self.command in ("GET", "HEAD"):
+                found = query(store, table, params)
+                if found is None:
+                    return self.send_json(404, {"message": f"Unknown table {table}"})
+                rows, total = found
+                headers = {}
+                if "count=exact" in (self.headers.get("Prefer") or ""):
+                    headers["Content-Range"] = f"0-{max(len(rows) - 1, 0)}/{total}"
+                return self.send_json(200, [project(store, table, r, select) for r in rows], headers)
+
+            if self.command == "POST":
+                body = self.read_body()
+                rows = body if isinstance(body, list) else [body]
+                created = []
+                for row in rows:
+                    row = dict(row)
+                    row.setdefault("id", str(uuid.uuid4()))
+                    row.setdefault("created_at", datetime.now(timezone.utc).isoformat())
+                    store.tables.setdefault(table, []).append(row)
+                    created.append(row)
+                return self.send_json(201, created)
+
+            found = query(store, table, params)
+            if found is None:
+                return self.send_json(404, {"message": f"Unknown table {table}"})
+            rows, _ = found
+            if self.command == "PATCH":
+                body = self.read_body() or {}
+                for row in rows:
+                    row.update(body)
+                return self.send_json(200, rows)
+            if self.command == "DELETE":
+                ids = {id(r) for r in rows}
+                store.tables[table] = [r for r in store.tables[table] if id(r) not in ids]
+                return self.send_json(200, rows)
+        return self.send_json(405, {"message": "Method not allowed"})
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--db-latency-ms", type=float, default=5)
+    parser.add_argument("--auth-latency-ms", type=float, default=20)
+    parser.add_argument("--llm-delay-ms", type=float, default=1500)
+    parser.add_argument("--llm-output-kb", type=int, default=20)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--carts", type=int, default=500)
+    parser.add_argument("--code-kb", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true")
+    return parser
+
+
+def make_server(config):
+    server = ThreadingHTTPServer((config.host, config.port), Handler)
+    server.daemon_threads = True
+    server.config = config
+    server.store = Store(config.users, config.carts, config.code_kb, config.seed)
+    return server
+
+
+def main():
+    config = build_parser().parse_args()
+    server = make_server(config)
+    print(f"Fake upstream listening on http://{config.host}:{server.server_port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Measures how long `import app` takes in a fresh interpreter, i.e. worker boot cost.
+
+    python bench/import_time.py                       # median of 7 runs + slowest imports
+    python bench/import_time.py --save bench/results/import_baseline.json
+    python bench/import_time.py --baseline bench/results/import_baseline.json --tolerance 0.25
+    python bench/import_time.py --budget-ms 400
+
+Exits non-zero when the median exceeds the budget or regresses past the baseline,
+or when a module that should load lazily (see --lazy) is imported at boot.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Loaded on first use in app.py; importing any of these at boot is a regression
+LAZY_MODULES = ("google.genai", "PIL.Image", "zstandard")
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app
+elapsed = time.perf_counter() - started
+print(json.dumps({"ms": elapsed * 1000, "modules": sorted(sys.modules)}))
+"""
+
+
+def clean_env():
+    # Boot as a worker would: no preload, no real upstreams
+    env = dict(os.environ)
+    env.pop("PRELOAD_APP", None)
+    env.setdefault("APIKEY", "bench-key")
+    return env
+
+
+def measure(runs):
+    samples, modules = [], set()
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", PROBE], cwd=ROOT, env=clean_env(), capture_output=True, text=True, check=True)
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        samples.append(result["ms"])
+        modules = set(result["modules"])
+    return samples, modules
+
+
+def slowest_imports(limit):
+    """Modules imported directly by app.py, by cumulative import time (-X importtime)."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=ROOT, env=clean_env(), capture_output=True, text=True, check=True)
+    totals = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        cumulative = cumulative.strip()
+        # One level of indentation below `app` means app.py imported it directly
+        if not cumulative.isdigit() or not name.startswith("   ") or name.startswith("     "):
+            continue
+        totals.append((int(cumulative) / 1000, name.strip()))
+    return sorted(totals, reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--budget-ms", type=float, help="fail if the median exceeds this")
+    parser.add_argument("--baseline", help="result file from a previous --save")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed regression vs baseline (fraction)")
+    parser.add_argument("--save", help="write the result here for later --baseline runs")
+    parser.add_argument("--lazy", default=",".join(LAZY_MODULES), help="modules that must not load at import time")
+    args = parser.parse_args()
+
+    samples, modules = measure(args.runs)
+    median = statistics.median(samples)
+    print(f"import app: median {median:.0f}ms  min {min(samples):.0f}ms  max {max(samples):.0f}ms  ({args.runs} runs)")
+    for ms, name in slowest_imports(8):
+        print(f"  {ms:8.1f}ms  {name}")
+
+    failures = []
+    eager = [name for name in args.lazy.split(",") if name and name in modules]
+    if eager:
+        failures.append(f"imported at boot but should be lazy: {', '.join(eager)}")
+    if args.budget_ms is not None and median > args.budget_ms:
+        failures.append(f"median {median:.0f}ms is over the {args.budget_ms:.0f}ms budget")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["median_ms"]
+        limit = baseline * (1 + args.tolerance)
+        print(f"baseline {baseline:.0f}ms, limit {limit:.0f}ms")
+        if median > limit:
+            failures.append(f"median {median:.0f}ms regressed past {limit:.0f}ms")
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump({"median_ms": round(median, 1), "samples_ms": [round(s, 1) for s in samples]}, f, indent=2)
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
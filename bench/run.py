@@ -0,0 +1,335 @@
+"""Offline load test for app.py against local Supabase and LLM stand-ins.
+
+Starts bench/fake_upstream.py and the app (bench/serve_app.py, or --server-cmd),
+drives each scenario with a pool of client threads, and writes throughput and
+latency percentiles to bench/results/<label>.json for bench/compare.py.
+
+    python bench/run.py --label before --duration 10 --concurrency 16
+    python bench/run.py --label after --scenarios feed,cart,socket
+    python bench/compare.py bench/results/before.json bench/results/after.json
+"""
+import argparse
+import json
+import os
+import shlex
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+sys.path.insert(0, BENCH_DIR)
+
+from fake_upstream import ADMIN_USERNAME, token_for  # noqa: E402
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    ms = lambda v: None if v is None else round(v * 1000, 2)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1] if latencies else None),
+    }
+
+
+def wait_for(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.1)
+    raise RuntimeError(f"Timed out waiting for {url}")
+
+
+# --- HTTP scenarios ---
+# Each returns (method, path, kwargs) for one request; `ctx` holds seeded ids.
+
+def scenario_feed(ctx, i):
+    return "GET", "/api/carts", {}
+
+
+def scenario_feed_popular(ctx, i):
+    return "GET", "/api/carts?sort=popular", {}
+
+
+def scenario_cart(ctx, i):
+    return "GET", f"/api/carts/{ctx['cart_ids'][i % len(ctx['cart_ids'])]}", {}
+
+
+def scenario_site(ctx, i):
+    return "GET", f"/site/{ctx['cart_ids'][i % len(ctx['cart_ids'])]}", {}
+
+
+def scenario_zip(ctx, i):
+    return "GET", f"/api/project/{ctx['cart_ids'][i % len(ctx['cart_ids'])]}", {}
+
+
+def scenario_auth_user(ctx, i):
+    return "GET", "/api/auth/user", {"headers": {"Authorization": f"Bearer {ctx['tokens'][i % len(ctx['tokens'])]}"}}
+
+
+def scenario_search(ctx, i):
+    terms = ("space", "puzzle game", "rac", "platformer number", "game 1")
+    return "GET", f"/api/search?q={terms[i % len(terms)]}", {}
+
+
+def scenario_generate(ctx, i):
+    return "POST", "/api/generate", {
+        "headers": {"Authorization": f"Bearer {ctx['tokens'][i % len(ctx['tokens'])]}"},
+        "json": {"prompt": f"benchmark game {i}", "provider": ctx["generate_provider"]},
+    }
+
+
+HTTP_SCENARIOS = {
+    "feed": scenario_feed,
+    "feed_popular": scenario_feed_popular,
+    "cart": scenario_cart,
+    "site": scenario_site,
+    "zip": scenario_zip,
+    "auth_user": scenario_auth_user,
+    "search": scenario_search,
+    "generate": scenario_generate,
+}
+
+
+def run_http_scenario(base_url, build, ctx, concurrency, duration, warmup):
+    latencies, errors = [], 0
+    lock = threading.Lock()
+    counter = iter(range(10 ** 12))
+    start = time.monotonic()
+    measure_from = start + warmup
+    deadline = measure_from + duration
+
+    def worker():
+        nonlocal errors
+        session = requests.Session()
+        local_latencies, local_errors = [], 0
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            with lock:
+                i = next(counter)
+            method, path, kwargs = build(ctx, i)
+            t0 = time.perf_counter()
+            try:
+                resp = session.request(method, base_url + path, timeout=300, **kwargs)
+                resp.content
+                ok = resp.status_code < 400
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - t0
+            if now >= measure_from:
+                if ok:
+                    local_latencies.append(elapsed)
+                else:
+                    local_errors += 1
+        with lock:
+            latencies.extend(local_latencies)
+            errors += local_errors
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return summarize(latencies, errors, duration)
+
+
+# --- Socket.IO relay scenario ---
+
+def run_socket_scenario(base_url, rooms, clients_per_room, rate, duration, transport):
+    import socketio
+
+    latencies, errors = [], 0
+    lock = threading.Lock()
+    clients = []
+
+    def on_state_update(payload):
+        if isinstance(payload, dict) and "sent" in payload:
+            with lock:
+                latencies.append(time.time() - payload["sent"])
+
+    for r in range(rooms):
+        for _ in range(clients_per_room):
+            client = socketio.Client(reconnection=False)
+            client.on("state_update", on_state_update)
+            client.connect(base_url, transports=[transport])
+            client.emit("join", {"room": f"bench-room-{r}"})
+            clients.append((f"bench-room-{r}", client))
+    time.sleep(0.5)
+
+    deadline = time.monotonic() + duration
+
+    def sender(room, client):
+        nonlocal errors
+        interval = 1.0 / rate
+        while time.monotonic() < deadline:
+            try:
+                client.emit("state_update", {"room": room, "data": {"sent": time.time(), "x": 1, "y": 2}})
+            except Exception:
+                with lock:
+                    errors += 1
+            time.sleep(interval)
+
+    threads = [threading.Thread(target=sender, args=pair) for pair in clients]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    time.sleep(0.5)
+    closers = [threading.Thread(target=client.disconnect) for _, client in clients]
+    for t in closers:
+        t.start()
+    for t in closers:
+        t.join()
+
+    # "requests" here counts relayed messages delivered to peers
+    result = summarize(latencies, errors, duration)
+    result["sent_rate_target"] = rooms * clients_per_room * rate
+    return result
+
+
+# --- Orchestration ---
+
+def start_processes(args):
+    fake_url = f"http://127.0.0.1:{args.fake_port}"
+    app_url = f"http://127.0.0.1:{args.app_port}"
+    fake_cmd = [
+        sys.executable, os.path.join(BENCH_DIR, "fake_upstream.py"),
+        "--port", str(args.fake_port),
+        "--db-latency-ms", str(args.db_latency_ms),
+        "--auth-latency-ms", str(args.auth_latency_ms),
+        "--llm-delay-ms", str(args.llm_delay_ms),
+        "--llm-output-kb", str(args.llm_output_kb),
+        "--jitter-ms", str(args.jitter_ms),
+        "--carts", str(args.carts),
+        "--code-kb", str(args.code_kb),
+    ]
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": fake_url,
+        "DATABASE_KEY": "bench-service-key",
+        "SUPABASE_ANON_KEY": "bench-anon-key",
+        "APIKEY": "bench-gemini-key",
+        "GEMINI_BASE_URL": f"{fake_url}/gemini/",
+        "OPENROUTERKEY": "bench-openrouter-key",
+        "OPENROUTER_URL": f"{fake_url}/openrouter/api/v1/chat/completions",
+        "PORT": str(args.app_port),
+    })
+    if args.server_cmd:
+        app_cmd = shlex.split(args.server_cmd.format(port=args.app_port))
+    else:
+        app_cmd = [sys.executable, os.path.join(BENCH_DIR, "serve_app.py"), "--port", str(args.app_port)]
+
+    devnull = subprocess.DEVNULL
+    fake = subprocess.Popen(fake_cmd, stdout=devnull, stderr=devnull)
+    server = subprocess.Popen(app_cmd, cwd=ROOT_DIR, env=env, stdout=devnull, stderr=None if args.verbose else devnull)
+    wait_for(f"{fake_url}/rest/v1/carts?limit=1")
+    wait_for(f"{app_url}/health")
+    return fake, server, fake_url, app_url
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--label", default=datetime.now().strftime("%Y%m%d-%H%M%S"))
+    parser.add_argument("--scenarios", default="feed,feed_popular,cart,site,zip,auth_user,search,generate,socket")
+    parser.add_argument("--duration", type=float, default=10, help="Measured seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=2, help="Unmeasured seconds before each scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--generate-concurrency", type=int, default=4)
+    parser.add_argument("--generate-provider", default="official", choices=["official", "openrouter"])
+    parser.add_argument("--socket-rooms", type=int, default=10)
+    parser.add_argument("--socket-clients-per-room", type=int, default=4)
+    parser.add_argument("--socket-rate", type=float, default=20, help="Messages per second per client")
+    parser.add_argument("--socket-transport", default="websocket", choices=["websocket", "polling"])
+    parser.add_argument("--fake-port", type=int, default=8900)
+    parser.add_argument("--app-port", type=int, default=5050)
+    parser.add_argument("--server-cmd", help="Command that serves app.py on {port}, e.g. \"gunicorn -w 4 --threads 8 -b 127.0.0.1:{port} app:app\"")
+    parser.add_argument("--db-latency-ms", type=float, default=5)
+    parser.add_argument("--auth-latency-ms", type=float, default=20)
+    parser.add_argument("--llm-delay-ms", type=float, default=1500)
+    parser.add_argument("--llm-output-kb", type=int, default=20)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--carts", type=int, default=500)
+    parser.add_argument("--code-kb", type=int, default=30)
+    parser.add_argument("--output", help="Result file (default bench/results/<label>.json)")
+    parser.add_argument("--verbose", action="store_true")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in scenarios if s not in HTTP_SCENARIOS and s != "socket"]
+    if unknown:
+        sys.exit(f"Unknown scenarios: {', '.join(unknown)}")
+
+    fake, server, fake_url, app_url = start_processes(args)
+    try:
+        listed = requests.get(f"{fake_url}/rest/v1/carts?select=id&is_listed=eq.true&limit=200").json()
+        ctx = {
+            "cart_ids": [row["id"] for row in listed],
+            "tokens": [token_for(f"bench-user-{i}") for i in range(50)],
+            "admin_token": token_for(ADMIN_USERNAME),
+            "generate_provider": args.generate_provider,
+        }
+
+        results = {}
+        for name in scenarios:
+            print(f"Running {name}...", flush=True)
+            if name == "socket":
+                results[name] = run_socket_scenario(app_url, args.socket_rooms, args.socket_clients_per_room, args.socket_rate, args.duration, args.socket_transport)
+            else:
+                concurrency = args.generate_concurrency if name == "generate" else args.concurrency
+                results[name] = run_http_scenario(app_url, HTTP_SCENARIOS[name], ctx, concurrency, args.duration, args.warmup)
+            r = results[name]
+            print(f"  {r['throughput_rps']:>9} req/s  p50 {r['p50_ms']} ms  p95 {r['p95_ms']} ms  p99 {r['p99_ms']} ms  errors {r['errors']}", flush=True)
+    finally:
+        server.terminate()
+        fake.terminate()
+        server.wait()
+        fake.wait()
+
+    report = {
+        "label": args.label,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": git_commit(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "verbose")},
+        "scenarios": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{args.label}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+"""Runs app.py on the threaded dev server for benchmarking.
+
+Configuration comes from the environment, exactly as in production; bench/run.py
+points it at the fake upstream before launching this script.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5050)
+    args = parser.parse_args()
+
+    import app
+    app.socketio.run(app.app, host=args.host, port=args.port, debug=False, use_reloader=False, log_output=False, allow_unsafe_werkzeug=True)
+
+
+if __name__ == "__main__":
+    main()
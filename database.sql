@@ -104,3 +104,126 @@ begin
   where id = row_id;
 end;
 $$ language plpgsql security definer;
+
+-- Full-text search over listed carts
+-- search_vector is maintained by Postgres on every insert/update; the partial
+-- GIN index only covers listed carts, which is all search ever returns.
+-- The backend never selects * from carts, so this column is not sent to clients.
+alter table public.carts add column if not exists search_vector tsvector
+  generated always as (
+    setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(prompt, '')), 'B')
+  ) stored;
+
+create index if not exists carts_search_idx on public.carts using gin (search_vector) where is_listed;
+
+-- RPC Function for ranked search with keyset pagination on (rank desc, id asc)
+-- search_query is a to_tsquery expression built by the backend, e.g. 'space:* & race:*'
+-- Every match is ranked before the page is cut, so cost grows with the match
+-- count; the backend drops prefix terms shorter than 3 characters for that reason.
+create or replace function search_carts(
+  search_query text,
+  result_limit integer default 20,
+  after_rank numeric default null,
+  after_id uuid default null
+)
+returns table (
+  id uuid,
+  user_id uuid,
+  username text,
+  name text,
+  prompt text,
+  model text,
+  views integer,
+  created_at timestamp with time zone,
+  profiles json,
+  rank numeric
+) as $$
+  with matches as (
+    select c.*, round(ts_rank(c.search_vector, q.query)::numeric, 6) as rank
+    from public.carts c, to_tsquery('english', search_query) as q(query)
+    where c.is_listed and c.search_vector @@ q.query
+  )
+  select m.id, m.user_id, m.username, m.name, m.prompt, m.model, m.views, m.created_at,
+         json_build_object('username', p.username, 'avatar_url', p.avatar_url) as profiles,
+         m.rank
+  from matches m
+  left join public.profiles p on p.id = m.user_id
+  where after_rank is null
+     or m.rank < after_rank
+     or (m.rank = after_rank and m.id > after_id)
+  order by m.rank desc, m.id asc
+  limit least(greatest(result_limit, 1), 100);
+$$ language sql stable security definer;
+
+-- RPC Function to approve or deny many credit requests in one transaction
+-- Returns one row per distinct id. Requests that are no longer pending are
+-- reported as already_processed and left untouched, so retries are safe.
+create or replace function process_credit_requests(request_ids uuid[], new_status text)
+returns table (
+  request_id uuid,
+  outcome text,
+  request_status text,
+  target_user_id uuid,
+  credits_added integer,
+  new_total integer
+) as $$
+#variable_conflict use_column
+declare
+  rid uuid;
+  req public.credit_requests%rowtype;
+  total integer;
+begin
+  if new_status not in ('approved', 'denied') then
+    raise exception 'new_status must be approved or denied';
+  end if;
+
+  -- Sorted, de-duplicated ids so concurrent batches lock rows in the same order
+  for rid in select distinct x from unnest(request_ids) as x order by x loop
+    select * into req from public.credit_requests where id = rid for update;
+    if not found then
+      return query select rid, 'not_found'::text, null::text, null::uuid, 0, null::integer;
+      continue;
+    end if;
+
+    if req.status <> 'pending' then
+      return query select rid, 'already_processed'::text, req.status, req.user_id, 0, null::integer;
+      continue;
+    end if;
+
+    total := null;
+    if new_status = 'approved' then
+      update public.profiles set credits = coalesce(credits, 0) + req.credits_requested
+      where id = req.user_id
+      returning credits into total;
+      if not found then
+        return query select rid, 'profile_not_found'::text, req.status, req.user_id, 0, null::integer;
+        continue;
+      end if;
+    end if;
+
+    update public.credit_requests set status = new_status where id = rid;
+    return query select rid, new_status, new_status, req.user_id,
+      case when new_status = 'approved' then req.credits_requested else 0 end, total;
+  end loop;
+end;
+$$ language plpgsql security definer;
+
+-- Security definer bypasses RLS, so only the backend (service role) may call it;
+-- PostgREST would otherwise expose it to anyone holding the anon key.
+revoke execute on function public.process_credit_requests(uuid[], text) from public, anon, authenticated;
+grant execute on function public.process_credit_requests(uuid[], text) to service_role;
+
+create index if not exists credit_requests_pending_idx on public.credit_requests (created_at desc, id desc) where status = 'pending';
+
+-- Original model output for carts whose stored code was minified at generation.
+-- Kept out of carts so feeds selecting * do not carry it.
+create table if not exists public.cart_sources (
+  cart_id uuid primary key references public.carts(id) on delete cascade,
+  code text not null,
+  created_at timestamp with time zone default timezone('utc'::text, now()) not null
+);
+
+alter table public.cart_sources enable row level security;
+drop policy if exists "Cart sources are public" on public.cart_sources;
+create policy "Cart sources are public" on public.cart_sources for select using (true);
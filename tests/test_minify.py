@@ -0,0 +1,196 @@
+"""Tests for the generated-code post-processing in app.py (minifiers and file normalisation).
+
+    python -m pytest tests
+
+The node --check test runs only when node is on PATH.
+"""
+import json
+import shutil
+import subprocess
+
+import pytest
+
+import app
+
+
+# --- JS ---
+
+def test_js_drops_comments_and_whitespace():
+    source = "// header\nconst a = 1 ;   /* block */  let b = a;\n\n\n"
+    assert app.minify_js(source) == "const a=1;let b=a;"
+
+
+@pytest.mark.parametrize("source, expected", [
+    # ASI: a newline before ++ ends the statement
+    ("let c = a\n++b", "let c=a\n++b"),
+    # ASI: `x = {}` then a call on the next line
+    ("x = {}\nfoo()", "x={}\nfoo()"),
+    # Restricted production: return followed by a newline returns undefined
+    ("function f() {\n  return\n  x\n}", "function f(){return\nx}"),
+    # A newline after ; , { ( [ is never needed
+    ("f(\n  a,\n  b\n);\n{\n  g()\n}", "f(a,b);{g()}"),
+])
+def test_js_keeps_newlines_asi_depends_on(source, expected):
+    assert app.minify_js(source) == expected
+
+
+def test_js_regex_literals_are_kept_verbatim():
+    source = "x = /[/\"']+\\//g; // comment\nreturn /a  b/i.test( s )"
+    assert app.minify_js(source) == "x=/[/\"']+\\//g;return /a  b/i.test(s)"
+
+
+def test_js_slash_after_operand_is_division():
+    assert app.minify_js("let q = a / b / c") == "let q=a / b / c"
+    assert app.minify_js("y = (a) / 2 // half") == "y=(a)/ 2"
+
+
+@pytest.mark.parametrize("source, expected", [
+    ("if (x) /a  b/.test(s)", "if(x)/a  b/.test(s)"),
+    ("while (f(a)) /x  y/g.exec(s)", "while(f(a))/x  y/g.exec(s)"),
+])
+def test_js_slash_after_condition_head_is_regex(source, expected):
+    assert app.minify_js(source) == expected
+
+
+def test_js_strings_keep_comment_markers():
+    source = "s = \"x // y\";  t = 'it\\'s /* not */ a comment'"
+    assert app.minify_js(source) == "s=\"x // y\";t='it\\'s /* not */ a comment'"
+
+
+def test_js_nested_templates_are_kept_verbatim():
+    source = "const t = `line1\n    ${ a + `inner ${ {k: 1}.k } // not comment` }  // text\n  end`;"
+    assert app.minify_js(source) == "const t=`line1\n    ${a + `inner ${{k:1}.k} // not comment`}  // text\n  end`;"
+
+
+def test_js_operators_that_would_merge_keep_their_space():
+    assert app.minify_js("c = a - -b; d = a + +b") == "c=a - -b;d=a + +b"
+
+
+def test_js_license_comments_are_kept():
+    assert app.minify_js("/*! MIT */\nvar a = 1") == "/*! MIT */\nvar a=1"
+
+
+@pytest.mark.parametrize("source", [
+    "var s = 'unterminated\n",
+    "var t = `unterminated ${ x }",
+    "var a = 1; /* unterminated",
+    "var r = /unterminated\n/;",
+])
+def test_js_untokenisable_input_is_returned_unchanged(source):
+    assert app.minify_js(source) == source
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+def test_js_output_still_parses(tmp_path):
+    source = "\n".join([
+        "// game loop",
+        "const re = /[/\"']+\\//g, s = 'x // y';",
+        "let a = 1",
+        "++a",
+        "const obj = {}",
+        ";(function () { return a / 2 / 1 })()",
+        "const t = `v ${ a > 0 ? `pos ${ a }` : 'neg' } // text`;",
+        "class P { #x = 1; get x() { return this.#x } }",
+        "if (a) { a-- } else { a = - -a }",
+        "label: for (const k of [1, 2]) { if (k) continue label }",
+    ])
+    path = tmp_path / "out.js"
+    path.write_text(app.minify_js(source))
+    result = subprocess.run(["node", "--check", str(path)], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+
+# --- CSS ---
+
+def test_css_drops_comments_and_tightens_punctuation():
+    source = "/* c */ a  >  b , .x { color : red ; margin: calc(1px + 2px) }"
+    assert app.minify_css(source) == "a>b,.x{color :red;margin:calc(1px + 2px)}"
+
+
+def test_css_keeps_descendant_space_before_colon_and_strings():
+    source = ".a :hover { content: \" a  /* b */ \" }"
+    assert app.minify_css(source) == ".a :hover{content:\" a  /* b */ \"}"
+
+
+def test_css_keeps_license_comments():
+    assert app.minify_css("/*! lic */ a { b: c }") == "/*! lic */ a{b:c}"
+
+
+# --- HTML ---
+
+def test_html_collapses_whitespace_between_tags_and_drops_comments():
+    source = "<p>Hello    <b>world</b>  </p>\n   <!-- note -->\n<div   class=\"a  b\"></div>"
+    assert app.minify_html(source) == "<p>Hello    <b>world</b> </p>\n<div   class=\"a  b\"></div>"
+
+
+def test_html_keeps_whitespace_in_pre_styled_text():
+    source = "<p style=\"white-space:pre\">Score:    10\n  Lives:  3</p>\n\n  <p>x</p>"
+    assert app.minify_html(source) == "<p style=\"white-space:pre\">Score:    10\n  Lives:  3</p>\n<p>x</p>"
+
+
+def test_html_keeps_whitespace_in_hidden_data():
+    source = "<div id=\"level\" hidden>\n#  .  #\n#     #\n</div>"
+    assert app.minify_html(source) == source
+
+
+def test_html_keeps_conditional_comments():
+    source = "<!--[if IE]><p>old</p><![endif]-->"
+    assert app.minify_html(source) == source
+
+
+def test_html_preserves_pre_and_textarea():
+    source = "<pre>  keep\n      this  </pre>\n\n<textarea>  a\n\n  b </textarea>"
+    assert app.minify_html(source) == "<pre>  keep\n      this  </pre>\n<textarea>  a\n\n  b </textarea>"
+
+
+def test_html_minifies_inline_style_and_script():
+    source = "<style>  body { margin : 0 }  </style><script>\n  // hi\n  let x = 1 ;\n</script>"
+    assert app.minify_html(source) == "<style>body{margin :0}</style><script>let x=1;</script>"
+
+
+def test_html_json_script_is_compacted_without_closing_the_element():
+    source = "<script type=\"application/ld+json\">{ \"a\" :  \"<\\/script>\" }</script>"
+    assert app.minify_html(source) == "<script type=\"application/ld+json\">{\"a\":\"<\\/script>\"}</script>"
+
+
+def test_html_leaves_unknown_script_types_alone():
+    source = "<script type=\"text/template\">  <p>  {{ x }}  </p>  </script>"
+    assert app.minify_html(source) == source
+
+
+# --- Files ---
+
+def test_normalize_files_validates_and_dedupes():
+    files = app.normalize_files([
+        {"name": "./index.html", "content": "<p>a</p>"},
+        {"name": "index.html", "content": "<p>a</p>"},
+        {"name": "/style.css", "content": "a{}"},
+        {"name": "style.css", "content": "b{}"},
+        {"name": "data.json", "content": {"x": 1}},
+        {"name": "", "content": "dropped"},
+        "not a file",
+    ])
+    assert files == [
+        {"name": "index.html", "content": "<p>a</p>"},
+        {"name": "style.css", "content": "b{}"},
+        {"name": "data.json", "content": "{\"x\": 1}"},
+    ]
+
+
+@pytest.mark.parametrize("files", ["index.html", [], [{"name": ""}], None])
+def test_normalize_files_rejects_unusable_structures(files):
+    with pytest.raises(Exception):
+        app.normalize_files(files)
+
+
+def test_postprocess_serialises_once_compactly():
+    structure = {"files": [{"name": "index.html", "content": "<p>é</p>\n\n  <p>x</p>"}], "title": "t"}
+    stored = app.postprocess_generated(structure, minify=True)
+    assert stored == '{"files":[{"name":"index.html","content":"<p>é</p>\\n<p>x</p>"}],"title":"t"}'
+    assert json.loads(app.postprocess_generated(structure, minify=False))["files"][0]["content"] == "<p>é</p>\n\n  <p>x</p>"
+
+
+def test_generate_rejects_non_boolean_minify(monkeypatch):
+    monkeypatch.setattr(app, "verify_token", lambda request: {"id": "u1", "credits": 5})
+    response = app.app.test_client().post("/api/generate", json={"prompt": "x", "minify": "false"})
+    assert response.status_code == 400